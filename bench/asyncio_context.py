@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+
+"""
+    bench.asyncio_context
+    ~~~~~~~~~~~~~~~~~~~~~
+
+    Runs a :class:`MainLoop` on an :class:`AsyncioMainContext` with a
+    repeating timeout, a pipe watch and idle callbacks while other asyncio
+    callbacks share the loop, checks that every source is dispatched and
+    reports how late the timeouts fired.
+
+    Needs trollius on Python 2.  Run from the top of the tree with
+    ``python bench/asyncio_context.py``.
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from nobix.utk import asyncio_context
+from nobix.utk.ulib import MainLoop, monotonic
+
+TICKS = 50
+INTERVAL = 0.01
+
+
+def main():
+    if asyncio_context.asyncio is None:
+        sys.exit("asyncio is not available, install trollius")
+    context = asyncio_context.AsyncioMainContext()
+    aio = context.get_loop()
+    loop = MainLoop(context)
+    stats = {'late': [], 'reads': 0, 'idles': 0, 'other': 0}
+    start = monotonic()
+
+    def tick():
+        expected = start + INTERVAL * (len(stats['late']) + 1)
+        stats['late'].append(monotonic() - expected)
+        if len(stats['late']) == TICKS:
+            loop.quit()
+            return False
+        return True
+
+    rd, wr = os.pipe()
+
+    def readable():
+        os.read(rd, 1)
+        stats['reads'] += 1
+
+    def idle():
+        stats['idles'] += 1
+        return stats['idles'] < 100
+
+    def other_work():
+        # stands for a network client sharing the loop
+        stats['other'] += 1
+        os.write(wr, 'x')
+        aio.call_later(0.002, other_work)
+
+    context.timeout_add_seconds(INTERVAL, tick)
+    context.io_add_watch(rd, readable)
+    context.idle_add(idle)
+    aio.call_soon(other_work)
+    loop.run()
+
+    late = sorted(stats['late'])
+    print "%d timeouts, late by median %.2fms, worst %.2fms" % (
+        len(late), late[len(late) // 2] * 1e3, late[-1] * 1e3)
+    print "%d pipe reads, %d idle calls, %d other asyncio callbacks" % (
+        stats['reads'], stats['idles'], stats['other'])
+    assert len(late) == TICKS and stats['idles'] == 100
+    assert stats['reads'] > 0 and stats['other'] > 0
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+
+"""
+    bench.decoder
+    ~~~~~~~~~~~~~
+
+    Decodes random keys and escape sequences with :class:`InputDecoder`
+    and with the :func:`urwid.escape.process_keyqueue` loop it replaced,
+    and reports keys per second for both.
+
+    Run from the top of the tree with ``python bench/decoder.py [keys]``.
+"""
+
+import os
+import sys
+import time
+import random
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from urwid import escape, util
+from nobix.utk.decoder import InputDecoder
+
+
+def process_keyqueue(codes):
+    keys = []
+    while codes:
+        run, codes = escape.process_keyqueue(codes, False)
+        keys.extend(run)
+    return keys
+
+def make_input(count):
+    sequences = [[ord(c)] for c in 'abcXYZ019 \t\r'] + [[1], [127], [0]]
+    sequences += [[27] + [ord(c) for c in s]
+                  for s, key in escape.input_sequences if s[-1] != 'M']
+    # a mouse event, a meta key and a cursor position report, which still
+    # go through process_keyqueue
+    sequences += [[27, ord('['), ord('M'), 32, 40, 50], [27, ord('a')],
+                  [27] + [ord(c) for c in '[12;5R']]
+    random.seed(1)
+    codes = []
+    for i in xrange(count):
+        codes.extend(random.choice(sequences))
+    return codes
+
+def rate(decode, codes):
+    start = time.time()
+    keys = decode(list(codes))
+    return keys, len(keys) / (time.time() - start)
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    util.set_encoding('utf8')
+    codes = make_input(count)
+    old_keys, old_rate = rate(process_keyqueue, codes)
+    new_keys, new_rate = rate(lambda c: InputDecoder().feed(c, False), codes)
+    assert old_keys == new_keys
+    print "%d keys" % len(new_keys)
+    print "process_keyqueue: %8.0f keys/s" % old_rate
+    print "InputDecoder:     %8.0f keys/s" % new_rate
+
+if __name__ == '__main__':
+    main()
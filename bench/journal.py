@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+
+"""
+    bench.journal
+    ~~~~~~~~~~~~~
+
+    Sustained sales per second with durability on: an fsync after every
+    sale against the group commit of :class:`Journal`, plus the latency of
+    :meth:`Journal.append`.
+
+    Before that it checks that journaled sales survive a restart while
+    they can't be posted: with no backend reachable, and in demo mode,
+    where the application must not replay them to its stand-in.
+
+    Run from the top of the tree with ``python bench/journal.py [seconds]
+    [directory]``, the directory should be on the disk the journal will
+    live on.
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import logging
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from nobix.journal import Journal
+from nobix.remote import RemoteAPI
+from nobix.remote.server import StandInServer
+from nobix.application import Application
+
+SALE = {
+    'lines': [{'code': 'A%d' % i, 'qty': 1, 'price': 9.5} for i in range(5)],
+    'total': 47.5,
+}
+
+
+def check_restart(directory, count=50):
+    path = os.path.join(directory, 'restart.log')
+    # the failed replays are expected
+    logging.getLogger('nobix').addHandler(logging.NullHandler())
+
+    # the backend can't be reached, replay keeps failing
+    remote_api = RemoteAPI('http://127.0.0.1:9', timeout=0.5, retries=0)
+    journal = Journal(path)
+    journal.start_replay(remote_api, retry_interval=0.1)
+    for i in range(count):
+        journal.append(dict(SALE, number=i))
+    journal.wait_durable(journal.seq)
+    time.sleep(0.5)
+    journal.close()
+    remote_api.close()
+    journal = Journal(path)
+    assert (journal.pending, journal.acked_seq) == (count, 0), \
+        (journal.pending, journal.acked_seq)
+    journal.close()
+
+    # demo mode leaves the real journal alone and replays nothing
+    app = Application()
+    app.parse_args(['--demo'])
+    app.create_remote_api()
+    app.create_journal()
+    assert app.journal.path != path and app.journal._replayer is None
+    app.journal.append(SALE)
+    app.journal.wait_durable(app.journal.seq)
+    assert not app.stand_in_server.sales
+    app.finalize()
+    assert not os.path.exists(app.demo_dir)
+    journal = Journal(path)
+    assert (journal.pending, journal.acked_seq) == (count, 0)
+    journal.close()
+
+    # once the backend is there every sale gets posted, once
+    server = StandInServer()
+    server.start()
+    remote_api = RemoteAPI(server.url)
+    journal = Journal(path)
+    journal.start_replay(remote_api)
+    deadline = time.time() + 5
+    while journal.pending and time.time() < deadline:
+        time.sleep(0.01)
+    journal.close()
+    remote_api.close()
+    server.stop()
+    assert [sale['number'] for sale in server.sales] == range(count), \
+        server.sales
+    return count
+
+def bench_fsync_each(path, seconds):
+    count = 0
+    with open(path, 'a') as f:
+        start = time.time()
+        while time.time() - start < seconds:
+            f.write(json.dumps(SALE) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+            count += 1
+    return count / (time.time() - start)
+
+def bench_journal(path, seconds):
+    journal = Journal(path)
+    latencies = []
+    start = time.time()
+    while time.time() - start < seconds:
+        before = time.time()
+        journal.append(SALE)
+        latencies.append(time.time() - before)
+    journal.wait_durable(journal.seq)
+    rate = len(latencies) / (time.time() - start)
+    journal.close()
+    latencies.sort()
+    return rate, journal.fsyncs, latencies
+
+def main():
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 2
+    directory = tempfile.mkdtemp(dir=sys.argv[2] if len(sys.argv) > 2
+                                 else None)
+    try:
+        count = check_restart(directory)
+        print "restart check:  %d sales kept until the backend got them" % (
+            count)
+        rate = bench_fsync_each(os.path.join(directory, 'each.log'), seconds)
+        print "fsync per sale: %8.0f sales/s" % rate
+        rate, fsyncs, latencies = bench_journal(
+            os.path.join(directory, 'journal.log'), seconds)
+        print "Journal:        %8.0f sales/s durable, %d sales per fsync" % (
+            rate, len(latencies) / max(fsyncs, 1))
+        print "append latency: p50 %.0fus  p99 %.0fus  max %.1fms" % (
+            latencies[len(latencies) // 2] * 1e6,
+            latencies[int(len(latencies) * 0.99)] * 1e6,
+            latencies[-1] * 1e3)
+    finally:
+        shutil.rmtree(directory)
+
+if __name__ == '__main__':
+    main()
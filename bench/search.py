@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+
+"""
+    bench.search
+    ~~~~~~~~~~~~
+
+    Builds search indexes of random catalogs, with descriptions of three to
+    six words out of about 8000, and types a few queries into
+    :class:`Search` a key at a time, reporting the worst and mean latency
+    per keystroke.
+
+    Run from the top of the tree with ``python bench/search.py [products
+    ...]``, by default for 10k, 100k and 1M products.
+"""
+
+import os
+import sys
+import time
+import random
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from nobix.catalog import Product, SearchIndex, Search
+
+QUERIES = (u'galletas chocolate', u'azucar leche', u'chocolat x')
+
+
+def make_vocabulary():
+    syllables = ['ca', 'co', 'la', 'ma', 'ri', 'to', 'ne', 'ga', 'lle', 'ta',
+                 'cho', 'pa', 'sa', 'de', 'mi', 'lo', 'fe', 'tu', 'ro', 'bi']
+    words = set()
+    for i in xrange(8000):
+        words.add(''.join(random.choice(syllables)
+                          for j in xrange(random.randint(2, 4))))
+    return list(words) + [u'galletas', u'chocolate', u'az\xfacar', u'leche']
+
+def build_index(count, vocabulary):
+    index = SearchIndex()
+    for i in xrange(count):
+        description = u' '.join(random.choice(vocabulary)
+                                for j in xrange(random.randint(3, 6)))
+        index.add(Product('P%d' % i, None, description, 1.0))
+    return index
+
+def type_query(index, query):
+    search = Search(index)
+    latencies = []
+    for end in xrange(1, len(query) + 1):
+        start = time.time()
+        results = search.search(query[:end])
+        latencies.append(time.time() - start)
+    return latencies, results
+
+def main():
+    counts = [int(arg) for arg in sys.argv[1:]] or [10000, 100000, 1000000]
+    random.seed(3)
+    vocabulary = make_vocabulary()
+    for count in counts:
+        start = time.time()
+        index = build_index(count, vocabulary)
+        print "%d products, index built in %.1fs" % (count,
+                                                     time.time() - start)
+        for query in QUERIES:
+            latencies, results = type_query(index, query)
+            print "  %-20r worst %5.1f ms  mean %5.1f ms  %d results" % (
+                query, max(latencies) * 1e3,
+                sum(latencies) / len(latencies) * 1e3, len(results))
+
+if __name__ == '__main__':
+    main()
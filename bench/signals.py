@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+
+"""
+    bench.signals
+    ~~~~~~~~~~~~~
+
+    Emits per second for a signal with only a class handler, one with a
+    connected callback and one with no listeners.
+
+    Run from the top of the tree with ``python bench/signals.py [count]``.
+"""
+
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from nobix.utk.signals import MetaSignals
+
+
+class Base(object):
+    __metaclass__ = MetaSignals
+    signals = ['show', 'notify', 'other']
+
+    def do_show(self):
+        pass
+
+
+class Leaf(Base):
+    signals = ['text']
+
+
+widget = Leaf()
+widget.connect('notify', lambda param: None)
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    for expr in ("widget.emit('show')", "widget.emit('notify', 'text')",
+                 "widget.emit('other')"):
+        elapsed = timeit.timeit(expr, number=count,
+                                setup='from __main__ import widget')
+        print "%-32s %9.0f emits/s" % (expr, count / elapsed)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+
+"""
+    bench.timers
+    ~~~~~~~~~~~~
+
+    Adds 100k timers to a :class:`TimerQueue`, cancels half of them and
+    drains the rest, then does the same through
+    :meth:`MainContext.timeout_add_seconds`.
+
+    Run from the top of the tree with ``python bench/timers.py [count]``.
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from nobix.utk.ulib import TimerQueue, MainContext
+
+
+def bench_queue(count):
+    queue = TimerQueue()
+    start = time.time()
+    timers = [queue.add(i % 1000, None) for i in xrange(count)]
+    for timer in timers[::2]:
+        timer.cancel()
+    fired = 0
+    while queue.next_deadline() is not None:
+        queue.pop()
+        fired += 1
+    return time.time() - start, fired
+
+def bench_context(count):
+    context = MainContext()
+    callback = lambda: None
+    start = time.time()
+    handles = [context.timeout_add_seconds(60 + i % 1000, callback)
+               for i in xrange(count)]
+    for handle in handles[::2]:
+        context.timeout_remove(handle)
+    return time.time() - start, len(context._alarms)
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    elapsed, fired = bench_queue(count)
+    print "TimerQueue: add %d, cancel half, drain %d: %.3fs" % (
+        count, fired, elapsed)
+    elapsed, pending = bench_context(count)
+    print "MainContext: add %d timeouts, remove half (%d left): %.3fs" % (
+        count, pending, elapsed)
+
+if __name__ == '__main__':
+    main()
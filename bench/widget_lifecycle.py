@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+
+"""
+    bench.widget_lifecycle
+    ~~~~~~~~~~~~~~~~~~~~~~
+
+    Opens and closes 100k labels, each connecting a handler of a long
+    lived object to its 'notify' signal, and reports the time taken, the
+    memory growth and the labels still alive afterwards.
+
+    Run from the top of the tree with
+    ``python bench/widget_lifecycle.py [count] [strong|weak]``.
+"""
+
+import os
+import sys
+import gc
+import time
+import weakref
+import resource
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from nobix.utk.label import Label
+
+
+class Observer(object):
+
+    def __init__(self):
+        self.notified = 0
+
+    def on_notify(self, param):
+        self.notified += 1
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    weak = len(sys.argv) > 2 and sys.argv[2] == 'weak'
+    observer = Observer()
+    alive = []
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.time()
+    for i in xrange(count):
+        label = Label("x")
+        label.connect('notify', observer.on_notify, weak=weak)
+        label.emit('notify', i)
+        if i % 100 == 0:
+            alive.append(weakref.ref(label))
+        del label
+    gc.collect()
+    elapsed = time.time() - start
+    growth = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss
+    print "%d labels, %s connections: %.3fs, %d notified" % (
+        count, 'weak' if weak else 'strong', elapsed, observer.notified)
+    print "max RSS growth %d KB, %d of %d sampled labels alive" % (
+        growth, sum(1 for ref in alive if ref() is not None), len(alive))
+
+if __name__ == '__main__':
+    main()
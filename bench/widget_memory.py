@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+
+"""
+    bench.widget_memory
+    ~~~~~~~~~~~~~~~~~~~
+
+    Creates 1M labels and reports the memory each one takes, measured as
+    the growth of the max RSS.
+
+    Run from the top of the tree with ``python bench/widget_memory.py
+    [count]``.
+"""
+
+import os
+import sys
+import gc
+import resource
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from nobix.utk.label import Label
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    gc.disable()
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    labels = [Label("x") for i in xrange(count)]
+    growth = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss
+    print "%d labels: %.0f bytes each" % (len(labels),
+                                          growth * 1024.0 / len(labels))
+
+if __name__ == '__main__':
+    main()
@@ -1,52 +1,232 @@
 # -*- coding: utf-8 -*-
 
-from urwid import MainLoop, ExitMainLoop
-from nobix.ui import MainWindow, LoginWindow
+import os
+import sys
+import itertools
+import logging
+
+from nobix import startup
+
+log = logging.getLogger(__name__)
+
+# seconds between catalog syncs
+CATALOG_SYNC_INTERVAL = 60
+
+# products added to the search index per main loop iteration
+SEARCH_INDEX_CHUNK = 1000
+
 
 class Application(object):
 
     def __init__(self):
-        pass
+        self.args = None
+        self.loop = None
+        self.main_window = None
+        self.login_window = None
+        self.remote_api = None
+        self.stand_in_server = None
+        self.demo_dir = None
+        self.catalog = None
+        self.search_index = None
+        self.journal = None
 
     def run(self):
         """Run commander"""
-        self.parse_args()
-        self.init_logger()
+        with startup.phase("parse args"):
+            self.parse_args()
+        with startup.phase("init logger"):
+            self.init_logger()
+        with startup.phase("create ui"):
+            self.create_ui()
 
-        self.create_ui()
-        self.create_remote_api()
+        # the main window and the remote api are built once the login
+        # prompt is on the screen
+        self.loop.set_alarm_in(0, self._finish_startup)
 
         self._run()
 
         self.finalize()
 
-    def parse_args(self):
-        print("Parsing args...")
+    def parse_args(self, args=None):
+        from argparse import ArgumentParser
+
+        parser = ArgumentParser(prog="nbx")
+        parser.add_argument("--remote-url",
+            help="url of the backend, required unless --demo is given")
+        parser.add_argument("--demo", action="store_true",
+            help="run against an in-process stand-in backend, with a "
+                 "throwaway catalog and journal")
+        parser.add_argument("--catalog",
+            help="path of the local catalog cache database")
+        parser.add_argument("--journal",
+            help="path of the journal of sales not posted yet")
+        parser.add_argument("--log-file",
+            help="write log messages to LOG_FILE")
+        parser.add_argument("--profile-startup", action="store_true",
+            help="report the time spent in each startup phase and import")
+        self.args = parser.parse_args(args)
+        if self.args.demo:
+            if self.args.remote_url or self.args.catalog or \
+                    self.args.journal:
+                parser.error("--demo can't be used with --remote-url, "
+                             "--catalog or --journal")
+        elif not self.args.remote_url:
+            parser.error("--remote-url is required unless --demo is given")
+        if self.args.profile_startup:
+            startup.enable()
 
     def init_logger(self):
-        print("Initiating logger...")
+        if self.args.log_file:
+            handler = logging.FileHandler(self.args.log_file)
+        else:
+            handler = logging.NullHandler()
+        handler.setFormatter(logging.Formatter(
+            "%(asctime)s %(name)s %(levelname)s: %(message)s"))
+        logger = logging.getLogger("nobix")
+        logger.addHandler(handler)
+        logger.setLevel(logging.INFO)
+        log.info("Logger initiated")
 
     def create_ui(self):
-        print("Creating user interface...")
-        self.main_window = MainWindow(self)
+        log.info("Creating login window...")
+        from urwid import MainLoop, SolidFill
+        from nobix.ui.login import LoginWindow
+
         self.login_window = LoginWindow(self, get_user=self.get_user)
+        self.loop = MainLoop(SolidFill(" "), input_filter=self.input_filter)
+
+    def create_main_window(self):
+        log.info("Creating main window...")
+        from nobix.ui.window import MainWindow
+
+        self.main_window = MainWindow(self)
+        self.login_window.overlay.bottom_w = self.main_window
 
     def create_remote_api(self):
-        print("Creating remote api ...")
+        log.info("Creating remote api...")
+        from nobix.remote import RemoteAPI
+
+        url = self.args.remote_url
+        if self.args.demo:
+            from nobix.remote.server import StandInServer
+            self.stand_in_server = StandInServer()
+            self.stand_in_server.start()
+            url = self.stand_in_server.url
+            log.warning("Demo mode, using stand-in server at %s", url)
+        self.remote_api = RemoteAPI(url, loop=self.loop)
+
+    def create_catalog(self):
+        log.info("Opening catalog...")
+        from nobix.catalog import CatalogCache, SearchIndex
+
+        if self.args.demo:
+            # never mix the stand-in catalog with the real one
+            path = ":memory:"
+        else:
+            path = self.args.catalog or self._data_path("catalog.db")
+        self.catalog = CatalogCache(path)
+        self.search_index = SearchIndex()
+        self._index_catalog(self.loop,
+                            iter([product.code for product in self.catalog]))
+        self._sync_catalog(self.loop)
+
+    def create_journal(self):
+        log.info("Opening sales journal...")
+        from nobix.journal import Journal
+
+        if self.args.demo:
+            # sales made in demo mode are thrown away on exit
+            import tempfile
+            self.demo_dir = tempfile.mkdtemp(prefix="nobix-demo-")
+            path = os.path.join(self.demo_dir, "journal.log")
+        else:
+            path = self.args.journal or self._data_path("journal.log")
+        self.journal = Journal(path)
+        # a sale acked by the stand-in is lost, demo sales are never
+        # posted anywhere
+        if self.stand_in_server is None:
+            self.journal.start_replay(self.remote_api)
+
+    def _data_path(self, name):
+        from nobix.settings import xdg_data_home
+        data_dir = os.path.join(xdg_data_home, "nobix")
+        if not os.path.isdir(data_dir):
+            os.makedirs(data_dir, 448) # 0o700
+        return os.path.join(data_dir, name)
+
+    def post_sale(self, sale):
+        """
+        Record a sale made, it is posted to the backend from the journal.
+        """
+        return self.journal.append(sale)
+
+    def _index_catalog(self, loop, codes):
+        # a chunk at a time, so the user interface keeps responding while
+        # a big catalog is indexed, products are read when their chunk is
+        # indexed so later changes are never undone
+        chunk = list(itertools.islice(codes, SEARCH_INDEX_CHUNK))
+        for code in chunk:
+            product = self.catalog.get(code)
+            if product is None:
+                self.search_index.remove(code)
+            else:
+                self.search_index.add(product)
+        if chunk:
+            loop.set_alarm_in(0, self._index_catalog, codes)
+
+    def _sync_catalog(self, loop, user_data=None):
+        self.catalog.sync(self.remote_api, self._catalog_synced)
+        loop.set_alarm_in(CATALOG_SYNC_INTERVAL, self._sync_catalog)
+
+    def _catalog_synced(self, codes, error):
+        if codes:
+            self._index_catalog(self.loop, iter(codes))
+
+    def _finish_startup(self, loop, user_data=None):
+        startup.mark("login prompt")
+        with startup.phase("create main window"):
+            self.create_main_window()
+        with startup.phase("create remote api"):
+            self.create_remote_api()
+        with startup.phase("open catalog"):
+            self.create_catalog()
+        with startup.phase("open journal"):
+            self.create_journal()
+        startup.mark("ready")
+        log.info("Startup finished")
 
     def _run(self):
-        self.loop = MainLoop(self.main_window, input_filter=self.input_filter)
         self.login_window.show()
 
         self.loop.run()
 
     def exit(self):
+        from urwid import ExitMainLoop
         raise ExitMainLoop()
 
     def finalize(self):
-        print("Finalizing")
+        log.info("Finalizing")
+        if self.journal is not None:
+            self.journal.close()
+        if self.catalog is not None:
+            self.catalog.close()
+        if self.remote_api is not None:
+            self.remote_api.close()
+        if self.stand_in_server is not None:
+            self.stand_in_server.stop()
+        if self.demo_dir is not None:
+            import shutil
+            shutil.rmtree(self.demo_dir, ignore_errors=True)
+        if startup.is_enabled():
+            startup.disable()
+            profile = startup.report()
+            log.info("Startup profile:\n%s", profile)
+            sys.stderr.write(profile)
 
     def get_user(self, username, password):
+        if self.main_window is None:
+            # still starting up
+            return False
         if username == "18" and password == "123":
             return True
         return False
@@ -0,0 +1,11 @@
+# -*- coding: utf-8 -*-
+
+"""
+    nobix.catalog
+    ~~~~~~~~~~~~~
+
+    Local product catalog.
+"""
+
+from nobix.catalog.cache import CatalogCache, Product
+from nobix.catalog.search import SearchIndex, Search
@@ -0,0 +1,207 @@
+# -*- coding: utf-8 -*-
+
+"""
+    nobix.catalog.cache
+    ~~~~~~~~~~~~~~~~~~~
+
+    Local copy of the product catalog.
+"""
+
+import time
+import sqlite3
+import logging
+from collections import namedtuple
+
+log = logging.getLogger(__name__)
+
+Product = namedtuple('Product', 'code barcode description price')
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS products (
+    code TEXT PRIMARY KEY,
+    barcode TEXT,
+    description TEXT,
+    price REAL
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value
+);
+"""
+
+
+class CatalogCache(object):
+    """
+    Product catalog kept in an SQLite database at path and indexed in
+    memory by code and barcode, so lookups never touch the network nor the
+    disk.
+
+    It is loaded from the backend once, later syncs only fetch the products
+    changed since the last one.  A product received with a true 'deleted'
+    field is removed.
+
+    hits and misses count the lookups, :attr:`staleness` is the time in
+    seconds since the last successful sync.
+    """
+
+    def __init__(self, path=':memory:', max_age=300):
+        self.path = path
+        self.max_age = max_age
+        self._db = sqlite3.connect(path)
+        self._db.executescript(_SCHEMA)
+        self._products = {}
+        self._barcodes = {}
+        self._syncing = False
+        self.synced_until = None
+        self.last_sync = None
+        self.hits = 0
+        self.misses = 0
+        self.syncs = 0
+        self._load()
+
+    def _load(self):
+        for row in self._db.execute(
+                "SELECT code, barcode, description, price FROM products"):
+            self._index(Product(*row))
+        meta = dict(self._db.execute("SELECT key, value FROM meta"))
+        self.synced_until = meta.get('synced_until')
+        self.last_sync = meta.get('last_sync')
+        log.info("Loaded %d products from %s", len(self._products), self.path)
+
+    def _index(self, product):
+        old = self._products.get(product.code)
+        if old is not None:
+            self._unindex_barcode(old)
+        self._products[product.code] = product
+        if product.barcode:
+            self._barcodes[product.barcode] = product
+
+    def _unindex(self, code):
+        old = self._products.pop(code, None)
+        if old is not None:
+            self._unindex_barcode(old)
+
+    def _unindex_barcode(self, product):
+        # the barcode may have moved to another product since
+        if product.barcode and \
+                self._barcodes.get(product.barcode) is product:
+            del self._barcodes[product.barcode]
+
+    def __len__(self):
+        return len(self._products)
+
+    def __contains__(self, code):
+        return code in self._products
+
+    def __iter__(self):
+        return self._products.itervalues()
+
+    def get(self, code):
+        """
+        Return the :class:`Product` with code, or None, without counting it
+        as a lookup.
+        """
+        return self._products.get(code)
+
+    def lookup(self, code):
+        """
+        Return the :class:`Product` with code or barcode, or None.
+        """
+        product = self._products.get(code)
+        if product is None:
+            product = self._barcodes.get(code)
+            if product is None:
+                self.misses += 1
+                return None
+        self.hits += 1
+        return product
+
+    @property
+    def staleness(self):
+        if self.last_sync is None:
+            return None
+        return max(0, time.time() - self.last_sync)
+
+    @property
+    def is_stale(self):
+        staleness = self.staleness
+        return staleness is None or staleness > self.max_age
+
+    def stats(self):
+        """
+        Return a dict with the cache metrics.
+        """
+        lookups = self.hits + self.misses
+        return {
+            'products': len(self._products),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': float(self.hits) / lookups if lookups else None,
+            'syncs': self.syncs,
+            'staleness': self.staleness,
+        }
+
+    def apply_changes(self, products, until):
+        """
+        Store the changed products, given as dicts, and remember until as
+        the backend time to ask for changes since in the next sync.
+
+        Returns the codes of the products changed or deleted.
+        """
+        upserts = []
+        deletes = []
+        for data in products:
+            if data.get('deleted'):
+                deletes.append((data['code'],))
+                self._unindex(data['code'])
+                continue
+            product = Product(data['code'], data.get('barcode'),
+                              data.get('description'), data.get('price'))
+            upserts.append(product)
+            self._index(product)
+
+        self.synced_until = until
+        self.last_sync = time.time()
+        with self._db:
+            self._db.executemany("INSERT OR REPLACE INTO products "
+                "(code, barcode, description, price) VALUES (?, ?, ?, ?)",
+                upserts)
+            self._db.executemany("DELETE FROM products WHERE code = ?",
+                                 deletes)
+            self._db.executemany("INSERT OR REPLACE INTO meta (key, value) "
+                "VALUES (?, ?)", [('synced_until', self.synced_until),
+                                  ('last_sync', self.last_sync)])
+        self.syncs += 1
+        log.info("Catalog sync: %d changed, %d deleted", len(upserts),
+                 len(deletes))
+        return [product.code for product in upserts] + \
+               [code for code, in deletes]
+
+    def sync(self, remote_api, callback=None):
+        """
+        Fetch the products changed since the last sync from remote_api,
+        callback(codes, error) is called once they are stored, with the
+        codes of the products changed or deleted.  Nothing is done if a
+        sync is already running.
+
+        The answer is handled in the thread running the remote api
+        callbacks, which must be the one that created the cache.
+        """
+        if self._syncing:
+            return
+        self._syncing = True
+
+        def done(result, error):
+            self._syncing = False
+            codes = []
+            if error is None:
+                codes = self.apply_changes(result['products'], result['until'])
+            else:
+                log.warning("Catalog sync failed: %s", error)
+            if callback is not None:
+                callback(codes, error)
+
+        remote_api.get_products(since=self.synced_until, callback=done)
+
+    def close(self):
+        self._db.close()
@@ -0,0 +1,319 @@
+# -*- coding: utf-8 -*-
+
+"""
+    nobix.catalog.search
+    ~~~~~~~~~~~~~~~~~~~~
+
+    Product search by partial description.
+"""
+
+import re
+import heapq
+import itertools
+import unicodedata
+from bisect import bisect_left, insort
+
+_word_re = re.compile(r'\w+', re.UNICODE)
+
+# smallest trigram similarity of a fuzzy match
+FUZZY_THRESHOLD = 0.5
+
+# most matches ranked for a query, a short query matching more only ranks
+# this many of them, preferring those where it matches whole words and
+# then those indexed first
+RANK_LIMIT = 2000
+
+# removed products left in the index before it is compacted, as long as
+# they are also more than half of it
+COMPACT_MIN = 1024
+
+# most matches of a query filtered again when it is extended, going
+# through the index is faster for more
+REUSE_LIMIT = 5000
+
+
+def normalize(text):
+    """
+    Return text lowercased and without accents, as a unicode string.
+    """
+    if isinstance(text, str):
+        text = text.decode('utf-8', 'replace')
+    text = unicodedata.normalize('NFKD', text.lower())
+    return u''.join([c for c in text if not unicodedata.combining(c)])
+
+def tokenize(text):
+    """
+    Return the normalized words of text.
+    """
+    return _word_re.findall(normalize(text))
+
+def _trigrams(word):
+    word = u' %s ' % word
+    return set([word[i:i+3] for i in range(len(word) - 2)])
+
+
+class SearchIndex(object):
+    """
+    Inverted index of the words in the product descriptions.
+
+    Every word of a query matches the description words it is a prefix of.
+    A query word matching none of them, at least three characters long,
+    matches the words sharing most of its trigrams instead, so typos still
+    find something.
+    """
+
+    def __init__(self):
+        self._products = []
+        self._doc_words = []
+        self._codes = {}
+        self._postings = {}
+        self._words = []
+        self._word_trigrams = {}
+        # changes every time the index does, see Search
+        self.version = 0
+
+    def __len__(self):
+        return len(self._codes)
+
+    def __contains__(self, code):
+        return code in self._codes
+
+    def add(self, product):
+        """
+        Index product, replacing the one with its code if any.
+        """
+        self.remove(product.code)
+        doc = len(self._products)
+        words = tuple(tokenize(product.description or u''))
+        self._products.append(product)
+        self._doc_words.append(words)
+        self._codes[product.code] = doc
+        for word in set(words):
+            postings = self._postings.get(word)
+            if postings is None:
+                postings = self._postings[word] = set()
+                insort(self._words, word)
+                for trigram in _trigrams(word):
+                    self._word_trigrams.setdefault(trigram, set()).add(word)
+            postings.add(doc)
+        self.version += 1
+
+    def remove(self, code):
+        """
+        Remove the product with code from the index.
+        """
+        doc = self._codes.pop(code, None)
+        if doc is None:
+            return
+        for word in set(self._doc_words[doc]):
+            postings = self._postings[word]
+            postings.discard(doc)
+            if not postings:
+                self._remove_word(word)
+        self._products[doc] = None
+        self._doc_words[doc] = ()
+        self.version += 1
+        removed = len(self._products) - len(self._codes)
+        if removed > COMPACT_MIN and removed > len(self._products) // 2:
+            self._compact()
+
+    def _remove_word(self, word):
+        del self._postings[word]
+        del self._words[bisect_left(self._words, word)]
+        for trigram in _trigrams(word):
+            words = self._word_trigrams[trigram]
+            words.discard(word)
+            if not words:
+                del self._word_trigrams[trigram]
+
+    def _compact(self):
+        # number the documents again without the removed ones
+        products = []
+        doc_words = []
+        for doc, product in enumerate(self._products):
+            if product is not None:
+                self._codes[product.code] = len(products)
+                products.append(product)
+                doc_words.append(self._doc_words[doc])
+        self._products = products
+        self._doc_words = doc_words
+        postings = dict((word, set()) for word in self._postings)
+        for doc, words in enumerate(doc_words):
+            for word in set(words):
+                postings[word].add(doc)
+        self._postings = postings
+
+    def _prefix_words(self, token):
+        words = self._words
+        start = bisect_left(words, token)
+        end = bisect_left(words, token + u'\uffff')
+        return words[start:end]
+
+    def _fuzzy_words(self, token):
+        if len(token) < 3:
+            return []
+        trigrams = _trigrams(token)
+        shared = {}
+        for trigram in trigrams:
+            for word in self._word_trigrams.get(trigram, ()):
+                shared[word] = shared.get(word, 0) + 1
+        words = []
+        for word, count in shared.iteritems():
+            # Dice coefficient of both trigram sets, a word has as many
+            # trigrams as characters
+            if 2.0 * count / (len(trigrams) + len(word)) >= FUZZY_THRESHOLD:
+                words.append(word)
+        return words
+
+    def _docs(self, words):
+        postings = self._postings
+        if len(words) == 1:
+            return set(postings[words[0]])
+        docs = set()
+        for word in words:
+            docs.update(postings[word])
+        return docs
+
+    def match(self, tokens):
+        """
+        Return (docs, fuzzy), the set of documents matching all tokens and
+        whether any of them needed a fuzzy match.
+        """
+        fuzzy = False
+        docs = None
+        # the longest token is usually the most selective, the others only
+        # filter what it matched
+        tokens = sorted(tokens, key=len, reverse=True)
+        for i, token in enumerate(tokens):
+            words = self._prefix_words(token)
+            if not words:
+                words = self._fuzzy_words(token)
+                if not words:
+                    return set(), fuzzy
+                fuzzy = True
+            elif docs is not None and len(words) > 8:
+                docs = self.filter(docs, tokens[i:i+1])
+                continue
+            if docs is None:
+                docs = self._docs(words)
+            else:
+                docs &= self._docs(words)
+            if not docs:
+                break
+        return docs or set(), fuzzy
+
+    def filter(self, docs, tokens):
+        """
+        Return the docs where every token is a prefix of some word.
+        """
+        doc_words = self._doc_words
+        result = set()
+        for doc in docs:
+            words = doc_words[doc]
+            for token in tokens:
+                for word in words:
+                    if word.startswith(token):
+                        break
+                else:
+                    break
+            else:
+                result.add(doc)
+        return result
+
+    def _first_docs(self, docs, limit):
+        # the limit docs indexed first, so the same ones every time
+        count = len(self._products)
+        if len(docs) * 16 >= count:
+            # a big part of the index, found quickly going through it
+            return list(itertools.islice(
+                (doc for doc in xrange(count) if doc in docs), limit))
+        return sorted(docs)[:limit]
+
+    def rank(self, docs, tokens, limit):
+        """
+        Return the limit best products of docs for tokens, products with
+        words equal to the tokens first, then those where they match the
+        earliest words, then those with shorter descriptions.
+        """
+        if len(docs) > RANK_LIMIT:
+            exact = set()
+            for token in tokens:
+                postings = self._postings.get(token)
+                if postings:
+                    exact |= docs & postings
+            docs = self._first_docs(exact or docs, RANK_LIMIT)
+
+        doc_words = self._doc_words
+        def key(doc):
+            words = doc_words[doc]
+            exact = 0
+            first = len(words)
+            for token in tokens:
+                for position, word in enumerate(words):
+                    if word.startswith(token):
+                        if word == token:
+                            exact += 1
+                        first = min(first, position)
+                        break
+            return (-exact, first, len(words), doc)
+        best = heapq.nsmallest(limit, docs, key=key)
+        return [self._products[doc] for doc in best]
+
+    def search(self, query, limit=50):
+        """
+        Return the limit best products matching query.
+        """
+        tokens = tokenize(query)
+        if not tokens:
+            return []
+        docs, fuzzy = self.match(tokens)
+        return self.rank(docs, tokens, limit)
+
+
+class Search(object):
+    """
+    Search as the query is typed.  When a query extends the previous one,
+    only the products that matched it are checked again, and the whole
+    index when none of them match anymore, so results don't depend on how
+    the query was typed.
+    """
+
+    def __init__(self, index, limit=50):
+        self.index = index
+        self.limit = limit
+        self._query = None
+        self._docs = None
+        self._version = None
+        self.reused = 0
+
+    def search(self, query):
+        """
+        Return the limit best products matching query.
+        """
+        index = self.index
+        query = normalize(query)
+        tokens = tokenize(query)
+        if not tokens:
+            self._query = None
+            return []
+
+        reuse = (self._query is not None and query.startswith(self._query) and
+                 self._version == index.version and
+                 len(self._docs) <= REUSE_LIMIT)
+        if reuse:
+            docs = index.filter(self._docs, tokens)
+            fuzzy = False
+            self.reused += 1
+        if not reuse or (not docs and
+                         not all(index._prefix_words(t) for t in tokens)):
+            # a word prefixing nothing may still match fuzzily
+            docs, fuzzy = index.match(tokens)
+
+        if fuzzy:
+            # fuzzy matches don't shrink as the query grows
+            self._query = None
+        else:
+            self._query = query
+            self._docs = docs
+            self._version = index.version
+        return index.rank(docs, tokens, self.limit)
@@ -0,0 +1,260 @@
+# -*- coding: utf-8 -*-
+
+"""
+    nobix.journal
+    ~~~~~~~~~~~~~
+
+    Local journal of the sales made, so selling goes on while the backend
+    can't be reached.
+"""
+
+import os
+import json
+import uuid
+import logging
+import threading
+
+from nobix.utk.ulib import monotonic
+from nobix.remote import RemoteError
+
+log = logging.getLogger(__name__)
+
+
+class Journal(object):
+    """
+    Append-only log of sales at path, one JSON record per line.
+
+    :meth:`append` only writes the sale to the operating system.  A commit
+    thread makes the records durable with a single fsync for up to
+    group_size records, or for those appended in group_time seconds,
+    whatever comes first.  :attr:`durable_seq` is the sequence number of
+    the last record known to be on disk.
+
+    Once :meth:`start_replay` is called, a replay thread posts the durable
+    sales not acknowledged yet to the backend in batches, retrying every
+    retry_interval seconds while it can't be reached.  Each sale is posted
+    with the journal id and its sequence number so the backend can drop
+    the ones it already got.
+    """
+
+    def __init__(self, path, group_size=64, group_time=0.02):
+        self.path = path
+        self.group_size = group_size
+        self.group_time = group_time
+
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+        self._closed = False
+        self._unsynced = 0
+        self._first_unsynced = None
+        self._pending = []
+
+        self.id = None
+        self.seq = 0
+        self.durable_seq = 0
+        self.acked_seq = 0
+        self.fsyncs = 0
+        self.replayed = 0
+
+        self._replayer = None
+        # set by the commit thread when there are new durable records
+        self._wakeup = threading.Event()
+        # set once the journal is closed, ends the replay retry waits
+        self._stopped = threading.Event()
+
+        self._open()
+        self._committer = threading.Thread(target=self._commit_loop,
+                                           name='journal-commit')
+        self._committer.daemon = True
+        self._committer.start()
+
+    def _open(self):
+        records = []
+        if os.path.exists(self.path):
+            with open(self.path) as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # a record cut by a crash, nothing after it was
+                        # made durable
+                        log.warning("Journal %s: dropped a partial record",
+                                    self.path)
+                        break
+                    if 'journal' in record:
+                        self.id = record['journal']
+                    elif 'ack' in record:
+                        self.acked_seq = max(self.acked_seq, record['ack'])
+                    else:
+                        records.append(record)
+        if self.id is None:
+            self.id = uuid.uuid4().hex
+
+        self._pending = [(r['seq'], r['sale']) for r in records
+                         if r['seq'] > self.acked_seq]
+        if records:
+            self.seq = max(r['seq'] for r in records)
+        self.seq = max(self.seq, self.acked_seq)
+        self.durable_seq = self.seq
+        log.info("Journal %s: %d sales to replay", self.path,
+                 len(self._pending))
+
+        # start over with only what still has to be replayed
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            f.write(json.dumps({'journal': self.id}) + '\n')
+            f.write(json.dumps({'ack': self.acked_seq}) + '\n')
+            for seq, sale in self._pending:
+                f.write(json.dumps({'seq': seq, 'sale': sale}) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        os.rename(tmp_path, self.path)
+        self._fsync_dir()
+        self._file = open(self.path, 'a')
+
+    def _fsync_dir(self):
+        fd = os.open(os.path.dirname(os.path.abspath(self.path)), os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    @property
+    def pending(self):
+        """
+        Number of sales not acknowledged by the backend yet.
+        """
+        return len(self._pending)
+
+    def append(self, sale):
+        """
+        Add sale to the journal and return its sequence number.
+        """
+        with self._lock:
+            if self._closed:
+                raise ValueError("journal is closed")
+            self.seq += 1
+            self._file.write(json.dumps({'seq': self.seq, 'sale': sale}) +
+                             '\n')
+            self._file.flush()
+            self._pending.append((self.seq, sale))
+            self._unsynced += 1
+            if self._unsynced == 1:
+                self._first_unsynced = monotonic()
+                self._changed.notify_all()
+            elif self._unsynced >= self.group_size:
+                self._changed.notify_all()
+            return self.seq
+
+    def wait_durable(self, seq, timeout=None):
+        """
+        Wait until the record seq is on disk.  Returns ``False`` if timeout
+        seconds passed before.
+        """
+        deadline = None if timeout is None else monotonic() + timeout
+        with self._lock:
+            while self.durable_seq < seq:
+                if deadline is None:
+                    self._changed.wait()
+                else:
+                    remaining = deadline - monotonic()
+                    if remaining <= 0:
+                        return False
+                    self._changed.wait(remaining)
+            return True
+
+    def _commit_loop(self):
+        with self._lock:
+            while True:
+                if not self._unsynced:
+                    if self._closed:
+                        return
+                    self._changed.wait()
+                    continue
+                # let the group fill up
+                deadline = self._first_unsynced + self.group_time
+                while self._unsynced < self.group_size and not self._closed:
+                    remaining = deadline - monotonic()
+                    if remaining <= 0:
+                        break
+                    self._changed.wait(remaining)
+                seq = self.seq
+                self._unsynced = 0
+                fd = self._file.fileno()
+                # appends go on while the disk works
+                self._lock.release()
+                try:
+                    os.fsync(fd)
+                finally:
+                    self._lock.acquire()
+                self.fsyncs += 1
+                self.durable_seq = seq
+                self._changed.notify_all()
+                self._wakeup.set()
+
+    def start_replay(self, remote_api, batch_size=100, retry_interval=5):
+        """
+        Start posting the journaled sales to the backend through
+        remote_api.  It must reach the real backend, the sales it acks are
+        dropped from the journal.
+        """
+        if self._replayer is not None:
+            return
+        self._replayer = threading.Thread(target=self._replay_loop,
+            args=(remote_api, batch_size, retry_interval),
+            name='journal-replay')
+        self._replayer.daemon = True
+        self._replayer.start()
+
+    def _replay_loop(self, remote_api, batch_size, retry_interval):
+        while True:
+            with self._lock:
+                if self._closed:
+                    return
+                batch = [(seq, sale) for seq, sale in
+                         self._pending[:batch_size]
+                         if seq <= self.durable_seq]
+            if not batch:
+                self._wakeup.wait()
+                self._wakeup.clear()
+                continue
+
+            try:
+                remote_api.call_sync('post_sales', {
+                    'journal': self.id,
+                    'sales': [{'seq': seq, 'sale': sale}
+                              for seq, sale in batch],
+                })
+            except RemoteError as e:
+                log.warning("Journal replay failed, retrying in %ds: %s",
+                            retry_interval, e)
+                # new records don't make the backend come back sooner
+                self._stopped.wait(retry_interval)
+                continue
+
+            last = batch[-1][0]
+            with self._lock:
+                del self._pending[:len(batch)]
+                self.acked_seq = last
+                self.replayed += len(batch)
+                if not self._closed:
+                    # losing an ack only posts those sales again
+                    self._file.write(json.dumps({'ack': last}) + '\n')
+                    self._file.flush()
+
+    def close(self):
+        """
+        Make every record durable and stop the journal threads.
+        """
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._changed.notify_all()
+        self._stopped.set()
+        self._wakeup.set()
+        self._committer.join()
+        if self._replayer is not None:
+            self._replayer.join(1)
+        with self._lock:
+            self._file.close()
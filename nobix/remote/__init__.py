@@ -0,0 +1,11 @@
+# -*- coding: utf-8 -*-
+
+"""
+    nobix.remote
+    ~~~~~~~~~~~~
+
+    Access to the backend remote API.
+"""
+
+from nobix.remote.pool import ConnectionPool
+from nobix.remote.client import RemoteAPI, RemoteError, RemoteTimeout
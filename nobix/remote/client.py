@@ -0,0 +1,427 @@
+# -*- coding: utf-8 -*-
+
+"""
+    nobix.remote.client
+    ~~~~~~~~~~~~~~~~~~~
+
+    Client of the backend remote API.
+"""
+
+import os
+import json
+import time
+import socket
+import httplib
+import logging
+import threading
+import itertools
+import urlparse
+from collections import deque
+from contextlib import contextmanager
+from Queue import Queue, Empty
+
+from nobix.utk.ulib import monotonic, TimerQueue
+from nobix.remote.pool import ConnectionPool
+
+log = logging.getLogger(__name__)
+
+# calls whose deadlines are further apart than this many seconds go in
+# separate requests, so a short call doesn't wait for a long one
+BATCH_DEADLINE_SPREAD = 1.0
+
+
+class RemoteError(Exception):
+    """
+    Error reported by the backend, or raised while talking to it.
+    """
+
+
+class RemoteTimeout(RemoteError):
+    """
+    The backend didn't answer a call in time.
+    """
+
+
+class Call(object):
+    """
+    A call to a remote method.  Once it completes, either result or error
+    is set, done is true and it is passed to callback(result, error).
+    """
+    __slots__ = ('id', 'method', 'params', 'callback', 'deadline',
+                 'result', 'error', 'event', 'done', 'timer')
+
+    def __init__(self, id, method, params, callback, deadline):
+        self.id = id
+        self.method = method
+        self.params = params
+        self.callback = callback
+        self.deadline = deadline
+        self.result = None
+        self.error = None
+        self.event = None
+        self.done = False
+        # the Timer failing the call at its deadline
+        self.timer = None
+
+
+class RemoteAPI(object):
+    """
+    Client of the backend remote API at url.
+
+    Calls are queued and sent by worker threads over a pool of keep-alive
+    connections.  The calls queued while the workers are busy, and those
+    made inside a :meth:`batch` block, go out together in a single request
+    to the batch endpoint.
+
+    When loop (an urwid MainLoop) is given, callbacks run in the thread
+    running it, woken up through a pipe, so the user interface never waits
+    on the network.  Otherwise they run in the worker threads.
+
+    Every call fails with :class:`RemoteTimeout` at its own deadline, even
+    while it waits in the queue or in a batch of slower calls, answers
+    arriving later are dropped.
+
+    A batch that fails before an answer arrives is sent again up to retries
+    times with the same X-Batch-Id header, the backend answers a repeated
+    batch id with the stored results instead of running its calls again.
+
+    Calls made after :meth:`close`, and those it leaves without an answer,
+    fail with :class:`RemoteError`.
+    """
+
+    def __init__(self, url, loop=None, workers=2, timeout=10, retries=2,
+                 max_batch=500):
+        parts = urlparse.urlsplit(url)
+        self.url = url
+        self.path = parts.path.rstrip('/') + '/batch'
+        self.pool = ConnectionPool(parts.hostname, parts.port, size=workers,
+                                   timeout=timeout)
+        self.timeout = timeout
+        self.retries = retries
+        self.max_batch = max_batch
+
+        self._ids = itertools.count(1)
+        self._batch_ids = itertools.count(1)
+        self._batch_prefix = '%x-%x' % (os.getpid(), int(time.time()))
+        self._pending = Queue()
+        self._grouped = None
+        self._done = deque()
+        self._done_lock = threading.Lock()
+        self._resolve_lock = threading.Lock()
+        self._deadlines = TimerQueue()
+        self._deadlines_changed = threading.Condition()
+        # no more calls are taken once closed, the deadline watcher runs
+        # until stopped
+        self._closed = False
+        self._stopped = False
+
+        self._loop = loop
+        self._pipe = None
+        if loop is not None:
+            self._pipe = loop.watch_pipe(self._deliver)
+
+        self.batches_sent = 0
+        self.calls_sent = 0
+
+        self._workers = []
+        for i in range(workers):
+            worker = threading.Thread(target=self._work,
+                                      name='remote-api-%d' % i)
+            worker.daemon = True
+            worker.start()
+            self._workers.append(worker)
+        self._watcher = threading.Thread(target=self._watch_deadlines,
+                                         name='remote-api-deadlines')
+        self._watcher.daemon = True
+        self._watcher.start()
+
+    def call(self, method, params=None, callback=None, timeout=None):
+        """
+        Call the remote method with params, callback(result, error) is called
+        once it completes.  It fails with :class:`RemoteTimeout` when there
+        is no answer after timeout seconds.
+
+        Returns the :class:`Call`.
+        """
+        call = self._make_call(method, params, callback, timeout)
+        if self._grouped is not None:
+            self._grouped.append(call)
+        else:
+            self._queue([call])
+        return call
+
+    def call_sync(self, method, params=None, timeout=None):
+        """
+        Call the remote method and wait for its result, for use outside the
+        user interface thread.  Raises :class:`RemoteError` when it fails.
+        """
+        call = self._make_call(method, params, None, timeout)
+        call.event = threading.Event()
+        self._queue([call])
+        call.event.wait()
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+    @contextmanager
+    def batch(self):
+        """
+        Send all the calls made inside the block in a single request.
+        """
+        if self._grouped is not None:
+            yield
+            return
+        self._grouped = []
+        try:
+            yield
+        finally:
+            calls, self._grouped = self._grouped, None
+            if calls:
+                self._queue(calls)
+
+    def _make_call(self, method, params, callback, timeout):
+        if timeout is None:
+            timeout = self.timeout
+        return Call(next(self._ids), method, params, callback,
+                    monotonic() + timeout)
+
+    def _queue(self, calls):
+        with self._deadlines_changed:
+            if not self._closed:
+                for call in calls:
+                    call.timer = self._deadlines.add(call.deadline, call)
+                self._deadlines_changed.notify()
+                self._pending.put(calls)
+                return
+        self._fail(calls, RemoteError("remote api is closed"))
+
+    # backend methods
+
+    def ping(self, callback=None):
+        return self.call('ping', None, callback)
+
+    def get_products(self, since=None, callback=None):
+        return self.call('get_products', {'since': since}, callback)
+
+    def get_prices(self, codes, callback=None):
+        return self.call('get_prices', {'codes': list(codes)}, callback)
+
+    def post_sale(self, sale, callback=None):
+        """
+        Post a sale with all its lines, in a single call.
+        """
+        return self.call('post_sale', sale, callback)
+
+    def post_sales(self, journal, sales, callback=None):
+        """
+        Post sales replayed from a journal, a list of dicts with their
+        'seq' number and the 'sale'.  Those posted before are ignored.
+        """
+        return self.call('post_sales', {'journal': journal, 'sales': sales},
+                         callback)
+
+    # worker threads
+
+    def _work(self):
+        while True:
+            calls = self._pending.get()
+            if calls is None:
+                return
+            while len(calls) < self.max_batch:
+                try:
+                    more = self._pending.get_nowait()
+                except Empty:
+                    break
+                if more is None:
+                    # leave the stop request to its worker
+                    self._pending.put(None)
+                    break
+                calls.extend(more)
+            try:
+                for group in self._split_by_deadline(calls):
+                    self._send(group)
+            except Exception as e:
+                log.exception("Remote batch failed")
+                self._fail(calls, RemoteError(str(e)))
+
+    def _split_by_deadline(self, calls):
+        groups = []
+        group = []
+        for call in sorted(calls, key=lambda call: call.deadline):
+            if group and \
+                    call.deadline - group[0].deadline > BATCH_DEADLINE_SPREAD:
+                groups.append(group)
+                group = []
+            group.append(call)
+        if group:
+            groups.append(group)
+        # each batch keeps the order its calls were made in
+        return [sorted(group, key=lambda call: call.id) for group in groups]
+
+    def _send(self, calls):
+        now = monotonic()
+        expired = [call for call in calls if call.deadline <= now]
+        if expired:
+            self._fail(expired, RemoteTimeout("no time left to send the call"))
+        calls = [call for call in calls
+                 if call.deadline > now and not call.done]
+        if not calls:
+            return
+
+        body = json.dumps([{'id': call.id, 'method': call.method,
+                            'params': call.params} for call in calls])
+        headers = {
+            'Content-Type': 'application/json',
+            'X-Batch-Id': '%s-%d' % (self._batch_prefix,
+                                     next(self._batch_ids)),
+        }
+        deadline = max(call.deadline for call in calls)
+        attempt = 0
+        while True:
+            timeout = deadline - monotonic()
+            try:
+                if timeout <= 0:
+                    raise socket.timeout("timed out")
+                status, data = self.pool.request('POST', self.path, body,
+                                                 headers, timeout)
+                break
+            except socket.timeout as e:
+                self._fail(calls, RemoteTimeout(str(e)))
+                return
+            except (socket.error, httplib.HTTPException) as e:
+                attempt += 1
+                if attempt > self.retries:
+                    self._fail(calls, RemoteError(str(e) or repr(e)))
+                    return
+                log.warning("Remote batch failed (%r), retrying", e)
+                time.sleep(min(0.05 * 2 ** attempt, 1.0))
+
+        self.batches_sent += 1
+        self.calls_sent += len(calls)
+        if status != 200:
+            self._fail(calls, RemoteError("HTTP error %d: %s" % (status,
+                                                                 data)))
+            return
+
+        answers = dict((answer['id'], answer) for answer in json.loads(data))
+        now = monotonic()
+        resolved = []
+        for call in calls:
+            answer = answers.get(call.id)
+            result = error = None
+            if answer is None:
+                error = RemoteError("no answer for call %d" % call.id)
+            elif now > call.deadline:
+                error = RemoteTimeout("answer arrived too late")
+            elif answer.get('error') is not None:
+                error = RemoteError(answer['error'])
+            else:
+                result = answer.get('result')
+            if self._resolve(call, result, error):
+                resolved.append(call)
+        self._complete(resolved)
+
+    def _resolve(self, call, result=None, error=None):
+        """
+        Set the outcome of call, unless it has one already.  Returns whether
+        it was set.
+        """
+        with self._resolve_lock:
+            if call.done:
+                return False
+            call.done = True
+            call.result = result
+            call.error = error
+        if call.timer is not None:
+            with self._deadlines_changed:
+                call.timer.cancel()
+        return True
+
+    def _fail(self, calls, error):
+        self._complete([call for call in calls
+                        if self._resolve(call, error=error)])
+
+    def _watch_deadlines(self):
+        changed = self._deadlines_changed
+        with changed:
+            while not self._stopped:
+                now = monotonic()
+                expired = []
+                timer = self._deadlines.pop_due(now)
+                while timer is not None:
+                    expired.append(timer.callback)
+                    timer = self._deadlines.pop_due(now)
+                if expired:
+                    changed.release()
+                    try:
+                        self._fail(expired, RemoteTimeout("no answer in time"))
+                    finally:
+                        changed.acquire()
+                    continue
+                deadline = self._deadlines.next_deadline()
+                if deadline is None:
+                    changed.wait()
+                else:
+                    changed.wait(deadline - now)
+
+    def _complete(self, calls):
+        callbacks = []
+        for call in calls:
+            if call.event is not None:
+                call.event.set()
+            elif call.callback is not None:
+                callbacks.append(call)
+        if not callbacks:
+            return
+        if self._pipe is None:
+            self._run_callbacks(callbacks)
+            return
+        with self._done_lock:
+            wake = not self._done
+            self._done.extend(callbacks)
+        if wake:
+            os.write(self._pipe, 'r')
+
+    def _deliver(self, data):
+        with self._done_lock:
+            calls = list(self._done)
+            self._done.clear()
+        self._run_callbacks(calls)
+        return True
+
+    def _run_callbacks(self, calls):
+        for call in calls:
+            try:
+                call.callback(call.result, call.error)
+            except Exception:
+                log.exception("Remote call callback failed")
+
+    def close(self):
+        """
+        Stop the worker threads and close the connections.  The calls
+        already queued are sent first, those still without an answer when
+        the workers stop fail with :class:`RemoteError`.
+        """
+        with self._deadlines_changed:
+            if self._closed:
+                return
+            self._closed = True
+        for worker in self._workers:
+            self._pending.put(None)
+        for worker in self._workers:
+            worker.join(self.timeout)
+        self._workers = []
+        with self._deadlines_changed:
+            self._stopped = True
+            self._deadlines_changed.notify()
+            # every call without an answer still has its deadline timer
+            unanswered = []
+            while self._deadlines.next_deadline() is not None:
+                unanswered.append(self._deadlines.pop().callback)
+        self._watcher.join()
+        self._fail(unanswered, RemoteError("remote api is closed"))
+        self.pool.close()
+        if self._pipe is not None:
+            self._loop.remove_watch_pipe(self._pipe)
+            os.close(self._pipe)
+            self._pipe = None
@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+
+"""
+    nobix.remote.pool
+    ~~~~~~~~~~~~~~~~~
+
+    Pool of keep-alive HTTP connections to the backend.
+"""
+
+import socket
+import httplib
+import threading
+from Queue import LifoQueue, Empty, Full
+
+
+class ConnectionPool(object):
+    """
+    Keeps up to size idle HTTP/1.1 connections open to host, so requests
+    reuse them instead of connecting each time.  It is safe to use from
+    several threads at once.
+    """
+
+    def __init__(self, host, port=None, size=4, timeout=10):
+        self.host = host
+        self.port = port
+        self.size = size
+        self.timeout = timeout
+        self._idle = LifoQueue(size)
+        self._lock = threading.Lock()
+        self.connections_made = 0
+        self.requests_sent = 0
+
+    def _connect(self, timeout):
+        with self._lock:
+            self.connections_made += 1
+        return httplib.HTTPConnection(self.host, self.port, timeout=timeout)
+
+    def request(self, method, path, body=None, headers=None, timeout=None):
+        """
+        Send a request and return the (status, body) of the response.
+
+        A kept alive connection closed by the server since its last use is
+        replaced and the request sent again over a new one, any other error
+        is raised to the caller.
+        """
+        if timeout is None:
+            timeout = self.timeout
+        try:
+            conn = self._idle.get_nowait()
+            reused = True
+        except Empty:
+            conn = self._connect(timeout)
+            reused = False
+
+        while True:
+            conn.timeout = timeout
+            if conn.sock is not None:
+                conn.sock.settimeout(timeout)
+            try:
+                conn.request(method, path, body, headers or {})
+                response = conn.getresponse()
+                data = response.read()
+            except socket.timeout:
+                conn.close()
+                raise
+            except (socket.error, httplib.HTTPException):
+                conn.close()
+                if not reused:
+                    raise
+                conn = self._connect(timeout)
+                reused = False
+                continue
+            break
+
+        with self._lock:
+            self.requests_sent += 1
+        if response.will_close:
+            conn.close()
+        else:
+            try:
+                self._idle.put_nowait(conn)
+            except Full:
+                conn.close()
+        return response.status, data
+
+    def close(self):
+        """
+        Close the idle connections.
+        """
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except Empty:
+                break
@@ -0,0 +1,210 @@
+# -*- coding: utf-8 -*-
+
+"""
+    nobix.remote.server
+    ~~~~~~~~~~~~~~~~~~~
+
+    In-process stand-in for the backend, for tests, benchmarks and running
+    the application without one.
+"""
+
+import json
+import logging
+import threading
+from collections import OrderedDict
+from SocketServer import ThreadingMixIn
+from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+
+log = logging.getLogger(__name__)
+
+# answers kept to replay batches sent again by a client
+_MAX_STORED_BATCHES = 1000
+
+
+class _HTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class _RequestHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # send each answer in one segment, not one per header line
+    wbufsize = -1
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        if not self.path.endswith('/batch'):
+            self._reply(404, {'error': 'not found'})
+            return
+        length = int(self.headers.get('Content-Length', 0))
+        try:
+            calls = json.loads(self.rfile.read(length))
+        except ValueError:
+            self._reply(400, {'error': 'invalid json'})
+            return
+        batch_id = self.headers.get('X-Batch-Id')
+        self._reply(200, self.server.stand_in.run_batch(batch_id, calls))
+
+    def _reply(self, status, data):
+        body = json.dumps(data)
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        log.debug(format, *args)
+
+
+class StandInServer(object):
+    """
+    Serves the batch endpoint of the remote API on a local port from a
+    background thread.
+
+    Remote methods are looked up in :attr:`handlers`, a dict of callables
+    taking the call params, :meth:`register` adds more.  Posted sales are
+    kept in :attr:`sales`, the catalog in :attr:`products` is changed with
+    :meth:`set_product` and :meth:`delete_product`.
+    """
+
+    def __init__(self, address=('127.0.0.1', 0)):
+        self.handlers = {
+            'ping': lambda params: 'pong',
+            'post_sale': self._post_sale,
+            'post_sales': self._post_sales,
+            'get_products': self._get_products,
+            'get_prices': self._get_prices,
+        }
+        self.sales = []
+        # journal id -> last sequence number posted from it
+        self.journals = {}
+        # code -> product dict, 'updated' holds the catalog version it
+        # was last changed at
+        self.products = {}
+        self.catalog_version = 0
+        self.batches = 0
+        self.calls = 0
+        self._answers = OrderedDict()
+        # batch id -> Event set once the batch running with it answers
+        self._running = {}
+        self._lock = threading.Lock()
+        self._httpd = _HTTPServer(address, _RequestHandler)
+        self._httpd.stand_in = self
+        self._thread = None
+
+    @property
+    def url(self):
+        return 'http://%s:%d' % self._httpd.server_address[:2]
+
+    def register(self, method, handler):
+        """
+        Serve the remote method with handler(params).
+        """
+        self.handlers[method] = handler
+
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever,
+                                        name='stand-in-server')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is not None:
+            self._httpd.shutdown()
+            self._thread.join()
+            self._thread = None
+        self._httpd.server_close()
+
+    def run_batch(self, batch_id, calls):
+        """
+        Run the calls of a batch and return their answers.  A batch id seen
+        before gets the answers stored for it, waiting for them if that
+        batch is still running.
+
+        Batches run concurrently, the handlers lock what they share.
+        """
+        if batch_id is not None:
+            with self._lock:
+                answers = self._answers.get(batch_id)
+                running = self._running.get(batch_id)
+                if answers is None and running is None:
+                    self._running[batch_id] = threading.Event()
+            if answers is not None:
+                return answers
+            if running is not None:
+                running.wait()
+                with self._lock:
+                    return self._answers[batch_id]
+
+        answers = []
+        for call in calls:
+            handler = self.handlers.get(call.get('method'))
+            if handler is None:
+                answers.append({'id': call.get('id'),
+                                'error': 'unknown method %r' %
+                                         call.get('method')})
+                continue
+            try:
+                answers.append({'id': call['id'],
+                                'result': handler(call.get('params'))})
+            except Exception as e:
+                log.exception("Stand-in call %r failed", call)
+                answers.append({'id': call['id'], 'error': str(e)})
+
+        with self._lock:
+            self.batches += 1
+            self.calls += len(calls)
+            if batch_id is not None:
+                self._answers[batch_id] = answers
+                if len(self._answers) > _MAX_STORED_BATCHES:
+                    self._answers.popitem(last=False)
+                self._running.pop(batch_id).set()
+        return answers
+
+    def set_product(self, code, barcode=None, description=None, price=None):
+        with self._lock:
+            self.catalog_version += 1
+            self.products[code] = {
+                'code': code, 'barcode': barcode, 'description': description,
+                'price': price, 'updated': self.catalog_version,
+            }
+
+    def delete_product(self, code):
+        with self._lock:
+            self.catalog_version += 1
+            self.products[code] = {'code': code, 'deleted': True,
+                                   'updated': self.catalog_version}
+
+    def _get_products(self, params):
+        since = (params or {}).get('since') or 0
+        with self._lock:
+            return {
+                'products': [product for product in self.products.itervalues()
+                             if product['updated'] > since],
+                'until': self.catalog_version,
+            }
+
+    def _get_prices(self, params):
+        prices = {}
+        for code in params['codes']:
+            product = self.products.get(code)
+            if product is not None and not product.get('deleted'):
+                prices[code] = product['price']
+        return prices
+
+    def _post_sale(self, sale):
+        with self._lock:
+            self.sales.append(sale)
+            number = len(self.sales)
+        return {'number': number, 'lines': len(sale.get('lines', ()))}
+
+    def _post_sales(self, params):
+        with self._lock:
+            last = self.journals.get(params['journal'], 0)
+            for record in params['sales']:
+                if record['seq'] > last:
+                    self.sales.append(record['sale'])
+                    last = record['seq']
+            self.journals[params['journal']] = last
+        return {'last': last}
@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+
+"""
+    nobix.startup
+    ~~~~~~~~~~~~~
+
+    Startup time profiler, enabled with ``nbx --profile-startup``.
+
+    Records the time spent in each startup phase, the time since the
+    process started at some milestones, and the time spent importing
+    each module.
+"""
+
+import sys
+import time
+import __builtin__
+from contextlib import contextmanager
+
+_start = time.time()
+_enabled = False
+_real_import = None
+
+# (name, seconds) of the timed phases and (name, seconds since start)
+# of the milestones, in the order they happened
+_phases = []
+_marks = []
+
+# module name -> [total seconds, seconds excluding nested imports]
+_imports = {}
+_import_stack = []
+
+
+def enable():
+    """
+    Start recording phases and imports.
+    """
+    global _enabled, _real_import
+    if _enabled:
+        return
+    _enabled = True
+    _real_import = __builtin__.__import__
+    __builtin__.__import__ = _timed_import
+
+def disable():
+    """
+    Stop recording, the data recorded so far is kept for :func:`report`.
+    """
+    global _enabled
+    if not _enabled:
+        return
+    _enabled = False
+    __builtin__.__import__ = _real_import
+
+def is_enabled():
+    return _enabled
+
+def _timed_import(name, *args, **kwargs):
+    loaded = len(sys.modules)
+    _import_stack.append(0.0)
+    start = time.time()
+    try:
+        return _real_import(name, *args, **kwargs)
+    finally:
+        elapsed = time.time() - start
+        nested = _import_stack.pop()
+        if _import_stack:
+            _import_stack[-1] += elapsed
+        # only imports that loaded something are worth reporting
+        if len(sys.modules) != loaded:
+            times = _imports.setdefault(name, [0.0, 0.0])
+            times[0] += elapsed
+            times[1] += elapsed - nested
+
+@contextmanager
+def phase(name):
+    """
+    Time the enclosed block as the startup phase name.
+    """
+    start = time.time()
+    try:
+        yield
+    finally:
+        if _enabled:
+            _phases.append((name, time.time() - start))
+
+def mark(name):
+    """
+    Record the time since the process started as milestone name.
+    """
+    if _enabled:
+        _marks.append((name, time.time() - _start))
+
+def report(limit=20):
+    """
+    Return the recorded phases, milestones and the limit slowest imports
+    as a printable string.
+    """
+    lines = ["startup phases:"]
+    for name, seconds in _phases:
+        lines.append("  %-30s %8.1f ms" % (name, seconds * 1000))
+    lines.append("startup milestones:")
+    for name, seconds in _marks:
+        lines.append("  %-30s %8.1f ms" % (name, seconds * 1000))
+    lines.append("slowest imports (self / total):")
+    imports = sorted(_imports.items(), key=lambda item: -item[1][1])
+    for name, (total, own) in imports[:limit]:
+        lines.append("  %-30s %8.1f ms %8.1f ms" % (name, own * 1000,
+                                                    total * 1000))
+    return "\n".join(lines) + "\n"
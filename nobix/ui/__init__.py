@@ -8,5 +8,6 @@
 """
 
 from nobix.ui.entry import Password
-from nobix.ui.window import MainWindow
-from nobix.ui.login import LoginWindow
+
+# nobix.ui.window and nobix.ui.login are imported by the application when
+# each window is built, so the login prompt doesn't wait for the main window
@@ -1,13 +1,12 @@
 # -*- coding: utf-8 -*-
 
-import time
-
 from urwid import (
     WidgetWrap, Columns, Pile, Edit, Filler, Divider, Overlay,
     LineBox, Frame, Text
 )
 
-from nobix.ui import Password
+from nobix.ui.entry import Password
+from nobix.utk.ulib import monotonic
 
 
 class LoginWindow(WidgetWrap):
@@ -94,7 +93,7 @@ class LoginWindow(WidgetWrap):
         widget.orig_keypress = widget.keypress
         widget.keypress = self._wrapped_keypress
 
-        self._last_key_time = time.time()
+        self._last_key_time = monotonic()
         self._timeout_sig_id = self.app.loop.set_alarm_in(self.max_time+1,
                                                           self._check_logout)
 
@@ -120,15 +119,15 @@ class LoginWindow(WidgetWrap):
         self.pile.set_focus(0)
 
     def _wrapped_keypress(self, size, key):
-        self._last_key_time = time.time()
+        self._last_key_time = monotonic()
         if key == 'esc':
-            if self._out_count == 1 and (time.time() - self._evt_time) < 1:
+            if self._out_count == 1 and (monotonic() - self._evt_time) < 1:
                 self._out_count = 0
                 self._evt_time = 0
                 self.logout()
             else:
                 self._out_count = 1
-                self._evt_time = time.time()
+                self._evt_time = monotonic()
             return None
         else:
             return self.app.loop.widget.orig_keypress(size, key)
@@ -152,10 +151,10 @@ class LoginWindow(WidgetWrap):
         return self.password_entry.__class__.keypress(self.password_entry, size, key)
 
     def _check_logout(self, main_loop, user_data=None):
-        etime = int(time.time() - self._last_key_time)
+        etime = int(monotonic() - self._last_key_time)
         if etime >= self.max_time:
             self.logout()
         else:
-            main_loop.remove_alarm(self._timeout_sig_id)
+            # this alarm has already fired, just schedule the next check
             self._timeout_sig_id = main_loop.set_alarm_in(self.max_time-etime, self._check_logout)
         return False
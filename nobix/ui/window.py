@@ -1,14 +1,45 @@
 # -*- coding: utf-8 -*-
 
 import urwid
-from urwid import Frame, Filler, Text, AttrMap
+from urwid import (
+    Frame, Filler, Text, AttrMap, Edit, Pile, ListBox, SimpleListWalker,
+    connect_signal
+)
 
 class MainWindow(Frame):
 
     def __init__(self, app):
         self.app = app
+        self._search = None
+
+        self.search_entry = Edit(u"Buscar: ")
+        connect_signal(self.search_entry, 'change', self._search_changed)
+        self.results = SimpleListWalker([])
+        self.result_list = ListBox(self.results)
+        self.document = Filler(Text("<Document Body>"))
+
         self.__super.__init__(
-            Filler(Text("<Document Body>")),
-            Text("<Document Header>"),
+            self.document,
+            Pile([Text("<Document Header>"), self.search_entry]),
             Text("<Document Footer>"),
+            focus_part='header',
         )
+
+    def _search_changed(self, entry, text):
+        index = self.app.search_index
+        if index is None:
+            return
+        if self._search is None:
+            from nobix.catalog import Search
+            self._search = Search(index, limit=100)
+        products = self._search.search(text)
+        self.results[:] = [
+            Text(u"%-14s %-40s %10s" % (p.code, p.description,
+                                        "%.2f" % p.price
+                                        if p.price is not None else ""))
+            for p in products
+        ]
+        if text.strip():
+            self.body = self.result_list
+        else:
+            self.body = self.document
@@ -0,0 +1,201 @@
+# -*- coding: utf-8 -*-
+
+"""
+    utk.asyncio_context
+    ~~~~~~~~~~~~~~~~~~~
+
+    :class:`MainContext` running on top of an asyncio event loop, so the
+    user interface can share its thread with asyncio network clients.
+
+    Needs asyncio, which on Python 2 comes from the optional trollius
+    package (``pip install trollius``).  Without it this module still
+    imports, but creating an :class:`AsyncioMainContext` raises
+    :class:`ImportError`.
+"""
+
+import select
+
+try:
+    import asyncio
+except ImportError:
+    try:
+        import trollius as asyncio
+    except ImportError:
+        asyncio = None
+
+from ulib import MainContext, SelectBackend, PRIORITY_DEFAULT_IDLE
+
+
+class _Timeout(object):
+    """
+    Handle returned by :meth:`AsyncioMainContext.timeout_add_seconds`.
+    """
+    __slots__ = ('callback', 'interval', 'scheduled', 'handle')
+
+    def __init__(self, callback, interval, scheduled):
+        self.callback = callback
+        self.interval = interval
+        self.scheduled = scheduled
+        self.handle = None
+
+
+class AsyncioMainContext(MainContext):
+    """
+    A :class:`MainContext` whose sources are driven by an asyncio event
+    loop: timeouts are scheduled with ``call_at``, file watches with
+    ``add_reader`` and idle callbacks are dispatched from a callback
+    scheduled with ``call_soon`` whenever there are some pending.
+
+    Anything else running on the same asyncio loop (coroutines, transports)
+    makes progress while :meth:`iteration` waits.
+    """
+
+    def __init__(self, loop=None, idle_budget=0.01):
+        if asyncio is None:
+            raise ImportError("AsyncioMainContext needs asyncio, install "
+                              "trollius on Python 2")
+        super(AsyncioMainContext, self).__init__(backend=SelectBackend(),
+                                                 idle_budget=idle_budget)
+        if loop is None:
+            loop = asyncio.get_event_loop()
+        self._loop = loop
+        self._idle_handle = None
+        self._wakeup = None
+
+    def get_loop(self):
+        """
+        Returns the asyncio event loop this context runs on.
+        """
+        return self._loop
+
+    def iteration(self):
+        """
+        A single context iteration, runs the asyncio loop until one of the
+        context sources has been dispatched.
+        """
+        self._wakeup = asyncio.Future(loop=self._loop)
+        try:
+            self._loop.run_until_complete(self._wakeup)
+        finally:
+            self._wakeup = None
+
+    def _wake(self):
+        if self._wakeup is not None and not self._wakeup.done():
+            self._wakeup.set_result(None)
+
+    def pending(self):
+        """
+        Checks if any sources have pending event for the given context.
+        """
+        return bool(self._idle_callbacks)
+
+    def timeout_add_seconds(self, seconds, callback):
+        """
+        Call callback() given time from now. No parameters are passed to
+        callback. If callback returns ``True`` it is called again every
+        *seconds* until it returns a false value or is removed.
+
+        Returns a handle that may be passed to :meth:`timeout_remove`.
+        """
+        timeout = _Timeout(callback, seconds, self._loop.time() + seconds)
+        timeout.handle = self._loop.call_at(timeout.scheduled,
+                                            self._dispatch_asyncio_timeout,
+                                            timeout)
+        return timeout
+
+    def timeout_remove(self, handle):
+        """
+        Remove a timeout callback added with :meth:`timeout_add_seconds`
+        method.
+
+        Returns ``True`` if the timeout callback exists, ``False`` otherwise
+        """
+        if handle is self._firing:
+            self._firing = None
+            return True
+        if handle.handle is None:
+            return False
+        handle.handle.cancel()
+        handle.handle = None
+        return True
+
+    def _dispatch_asyncio_timeout(self, timeout):
+        timeout.handle = None
+        self._firing = timeout
+        try:
+            keep = timeout.callback()
+            if keep and timeout.interval and self._firing is timeout:
+                # count from the time it should have fired so the period
+                # does not drift, skipping the ticks that were missed
+                now = self._loop.time()
+                scheduled = timeout.scheduled + timeout.interval
+                if scheduled <= now:
+                    missed = int((now - scheduled) // timeout.interval) + 1
+                    scheduled += missed * timeout.interval
+                timeout.scheduled = scheduled
+                timeout.handle = self._loop.call_at(
+                    scheduled, self._dispatch_asyncio_timeout, timeout)
+        finally:
+            self._firing = None
+            self._wake()
+
+    def idle_add(self, callback, priority=PRIORITY_DEFAULT_IDLE):
+        """
+        Add a callback for idle. Callbacks with lower priority values run
+        first, if callback returns ``True`` it is called again in the next
+        idle dispatch.
+
+        Returns a handle that may be passed to :meth:`idle_remove`
+        """
+        handle = super(AsyncioMainContext, self).idle_add(callback, priority)
+        self._schedule_idle()
+        return handle
+
+    def _schedule_idle(self):
+        if self._idle_handle is None and self._idle_callbacks:
+            self._idle_handle = self._loop.call_soon(self._run_idle)
+
+    def _run_idle(self):
+        self._idle_handle = None
+        try:
+            self._dispatch_idle()
+        finally:
+            # whatever is left runs after the loop polled for events again
+            self._schedule_idle()
+            self._wake()
+
+    def io_add_watch(self, fd, callback):
+        """
+        Call callback() when fd has some data to read. No parameters are passed
+        to callback.
+
+        Returns a handle that may be passed to :meth:`io_remove_watch`.
+        """
+        if hasattr(fd, 'fileno'):
+            fd = fd.fileno()
+        self._watch_files[fd] = callback
+        self._loop.add_reader(fd, self._dispatch_io, fd)
+        return fd
+
+    def io_remove_watch(self, handle):
+        """
+        Remove an input file.
+
+        Returns ``True`` if the input file exists, ``False`` otherwsie.
+        """
+        if handle in self._watch_files:
+            del self._watch_files[handle]
+            self._loop.remove_reader(handle)
+            return True
+        return False
+
+    def _dispatch_io(self, fd):
+        callback = self._watch_files.get(fd)
+        try:
+            # trollius stops the loop from inside a callback, leaving the
+            # ready handles of that pass queued, and polls the fd again on
+            # the next iteration, so a handle may outlive its data
+            if callback is not None and select.select([fd], [], [], 0)[0]:
+                callback()
+        finally:
+            self._wake()
@@ -420,9 +420,88 @@ class AttrSpecError(Exception):
     pass
 
 
+def _parse_foreground(foreground, value):
+    """
+    Return value with the foreground color and settings replaced by the
+    ones described in foreground.
+    """
+    color = None
+    flags = 0
+    # handle comma-separated foreground
+    for part in foreground.split(','):
+        part = part.strip()
+        if part in _ATTRIBUTES:
+            # parse and store "settings"/attributes in flags
+            if flags & _ATTRIBUTES[part]:
+                raise AttrSpecError(("Setting %s specified more than" +
+                    "once in foreground (%s)") % (repr(part),
+                    repr(foreground)))
+            flags |= _ATTRIBUTES[part]
+            continue
+        # past this point we must be specifying a color
+        if part in ('', 'default'):
+            scolor = 0
+        elif part in _BASIC_COLORS:
+            scolor = _BASIC_COLORS.index(part)
+            flags |= _FG_BASIC_COLOR
+        elif value & _HIGH_88_COLOR:
+            scolor = _parse_color_88(part)
+            flags |= _FG_HIGH_COLOR
+        else:
+            scolor = _parse_color_256(part)
+            flags |= _FG_HIGH_COLOR
+        # _parse_color_*() return None for unrecognised colors
+        if scolor is None:
+            raise AttrSpecError(("Unrecognised color specification %s" +
+                "in foreground (%s)") % (repr(part), repr(foreground)))
+        if color is not None:
+            raise AttrSpecError(("More than one color given for " +
+                "foreground (%s)") % (repr(foreground),))
+        color = scolor
+    if color is None:
+        color = 0
+    return (value & ~_FG_MASK) | color | flags
+
+
+def _parse_background(background, value):
+    """
+    Return value with the background color replaced by the one described
+    in background.
+    """
+    flags = 0
+    if background in ('', 'default'):
+        color = 0
+    elif background in _BASIC_COLORS:
+        color = _BASIC_COLORS.index(background)
+        flags |= _BG_BASIC_COLOR
+    elif value & _HIGH_88_COLOR:
+        color = _parse_color_88(background)
+        flags |= _BG_HIGH_COLOR
+    else:
+        color = _parse_color_256(background)
+        flags |= _BG_HIGH_COLOR
+    if color is None:
+        raise AttrSpecError(("Unrecognised color specification " +
+            "in background (%s)") % (repr(background),))
+    return (value & ~_BG_MASK) | (color << _BG_SHIFT) | flags
+
+
+# AttrSpec instances already built, by (class, fg, bg, colors)
+_attrspec_cache = {}
+_ATTRSPEC_CACHE_SIZE = 4096
+
+
 class AttrSpec(object):
+    """
+    Immutable description of a foreground/background pair.
 
-    def __init__(self, fg, bg, colors=256):
+    AttrSpec objects are shared: building the same specification twice
+    returns the same object, and two specifications are equal when they
+    pack to the same value.
+    """
+    __slots__ = ('_value',)
+
+    def __new__(cls, fg, bg, colors=256):
         """
         fg -- a string containing a comma-separated foreground color
               and settings
@@ -475,17 +554,51 @@ class AttrSpec(object):
         AttrSpec('#dda', '#006')
         >>> AttrSpec('#ddb', '#004', 88)
         AttrSpec('#ccc', '#000', colors=88)
+        >>> AttrSpec('brown', 'default') is AttrSpec('brown', 'default')
+        True
         """
+        key = (cls, fg, bg, colors)
+        if key in _attrspec_cache:
+            return _attrspec_cache[key]
+
         if colors not in (1, 16, 88, 256):
             raise AttrSpecError('invalid number of colors (%d).' % colors)
-        self._value = 0 | _HIGH_88_COLOR * (colors == 88)
-        self.foreground = fg
-        self.background = bg
+        value = 0 | _HIGH_88_COLOR * (colors == 88)
+        value = _parse_foreground(fg, value)
+        value = _parse_background(bg, value)
+        self = object.__new__(cls)
+        object.__setattr__(self, '_value', value)
         if self.colors > colors:
             raise AttrSpecError(('foreground/background (%s/%s) require ' +
                 'more colors than have been specified (%d).') %
                 (repr(fg), repr(bg), colors))
 
+        if len(_attrspec_cache) >= _ATTRSPEC_CACHE_SIZE:
+            _attrspec_cache.clear()
+        _attrspec_cache[key] = self
+        return self
+
+    def __setattr__(self, name, value):
+        raise AttributeError("AttrSpec objects are immutable")
+
+    __delattr__ = __setattr__
+
+    def __reduce__(self):
+        return (_attrspec_from_value, (self.__class__, self._value))
+
+    def __eq__(self, other):
+        if not isinstance(other, AttrSpec):
+            return NotImplemented
+        return self._value == other._value
+
+    def __ne__(self, other):
+        if not isinstance(other, AttrSpec):
+            return NotImplemented
+        return self._value != other._value
+
+    def __hash__(self):
+        return hash(self._value)
+
     foreground_basic = property(lambda s: s._value & _FG_BASIC_COLOR != 0)
     foreground_high = property(lambda s: s._value & _FG_HIGH_COLOR != 0)
     foreground_number = property(lambda s: s._value & _FG_COLOR_MASK)
@@ -508,7 +621,7 @@ class AttrSpec(object):
             return 88
         if self._value & (_BG_HIGH_COLOR | _FG_HIGH_COLOR):
             return 256
-        if self._value & (_BG_BASIC_COLOR | _BG_BASIC_COLOR):
+        if self._value & (_BG_BASIC_COLOR | _FG_BASIC_COLOR):
             return 16
         return 1
     colors = property(_colors)
@@ -539,45 +652,7 @@ class AttrSpec(object):
             ',bold' * self.bold + ',standout' * self.standout +
             ',blink' * self.blink + ',underline' * self.underline)
 
-    def _set_foreground(self, foreground):
-        color = None
-        flags = 0
-        # handle comma-separated foreground
-        for part in foreground.split(','):
-            part = part.strip()
-            if part in _ATTRIBUTES:
-                # parse and store "settings"/attributes in flags
-                if flags & _ATTRIBUTES[part]:
-                    raise AttrSpecError(("Setting %s specified more than" +
-                        "once in foreground (%s)") % (repr(part),
-                        repr(foreground)))
-                flags |= _ATTRIBUTES[part]
-                continue
-            # past this point we must be specifying a color
-            if part in ('', 'default'):
-                scolor = 0
-            elif part in _BASIC_COLORS:
-                scolor = _BASIC_COLORS.index(part)
-                flags |= _FG_BASIC_COLOR
-            elif self._value & _HIGH_88_COLOR:
-                scolor = _parse_color_88(part)
-                flags |= _FG_HIGH_COLOR
-            else:
-                scolor = _parse_color_256(part)
-                flags |= _FG_HIGH_COLOR
-            # _parse_color_*() return None for unrecognised colors
-            if scolor is None:
-                raise AttrSpecError(("Unrecognised color specification %s" +
-                    "in foreground (%s)") % (repr(part), repr(foreground)))
-            if color is not None:
-                raise AttrSpecError(("More than one color given for " +
-                    "foreground (%s)") % (repr(foreground),))
-            color = scolor
-        if color is None:
-            color = 0
-        self._value = (self._value & ~_FG_MASK) | color | flags
-
-    foreground = property(_foreground, _set_foreground)
+    foreground = property(_foreground)
 
     def _background(self):
         """Return the background color."""
@@ -589,25 +664,7 @@ class AttrSpec(object):
             return _color_desc_88(self.background_number)
         return _color_desc_256(self.background_number)
 
-    def _set_background(self, background):
-        flags = 0
-        if background in ('', 'default'):
-            color = 0
-        elif background in _BASIC_COLORS:
-            color = _BASIC_COLORS.index(background)
-            flags |= _BG_BASIC_COLOR
-        elif self._value & _HIGH_88_COLOR:
-            color = _parse_color_88(background)
-            flags |= _BG_HIGH_COLOR
-        else:
-            color = _parse_color_256(background)
-            flags |= _BG_HIGH_COLOR
-        if color is None:
-            raise AttrSpecError(("Unrecognised color specification " +
-                "in background (%s)") % (repr(background),))
-        self._value = (self._value & ~_BG_MASK) | (color << _BG_SHIFT) | flags
-
-    background = property(_background, _set_background)
+    background = property(_background)
 
     def get_rgb_values(self):
         """
@@ -638,3 +695,10 @@ class AttrSpec(object):
             return vals + _COLOR_VALUES_88[self.background_number]
         else:
             return vals + _COLOR_VALUES_256[self.background_number]
+
+
+def _attrspec_from_value(cls, value):
+    """Rebuild an AttrSpec from its packed value (used for pickling)."""
+    self = object.__new__(cls)
+    object.__setattr__(self, '_value', value)
+    return self
@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+
+"""
+    utk.decoder
+    ~~~~~~~~~~~
+
+    Incremental decoder for the key codes read from a terminal.
+"""
+
+from urwid import escape
+from urwid import str_util
+
+ESC = 27
+
+# keys for the single byte codes, ESC is decoded through the trie
+_single_keys = [None] * 128
+for _code in range(128):
+    if _code != ESC:
+        _single_keys[_code] = escape.process_keyqueue([_code], False)[0][0]
+del _code
+
+
+class InputDecoder(object):
+    """
+    Turn key codes into keys as they are read from the terminal.
+
+    Printable characters, control keys and the escape sequences of
+    urwid's input trie are decoded by walking the codes with an index,
+    mouse events, cursor position reports, meta keys and multibyte
+    characters are handed to :func:`urwid.escape.process_keyqueue`.
+
+    The codes of a sequence cut at the end of a read are kept in
+    :attr:`pending` and completed by the next call to :meth:`feed`.
+    """
+
+    def __init__(self):
+        self.pending = []
+
+    def reset(self):
+        """
+        Forget the codes of an incomplete sequence.
+        """
+        self.pending = []
+
+    def feed(self, codes, more_available=True):
+        """
+        Decode codes and return the list of keys found.
+
+        more_available -- if True an incomplete sequence at the end of
+            codes is kept for the next call instead of being decoded as
+            separate keys
+        """
+        if self.pending:
+            codes = self.pending + codes
+            self.pending = []
+        keys = []
+        append = keys.append
+        single = _single_keys
+        trie = escape.input_trie.data
+        narrow = str_util.get_byte_encoding() == 'narrow'
+        n = len(codes)
+        i = 0
+        while i < n:
+            code = codes[i]
+            if code < 128 and code != ESC:
+                append(single[code])
+                i += 1
+                continue
+            if code == ESC:
+                node = trie
+                j = i + 1
+                while j < n and type(node) is dict:
+                    node = node.get(codes[j])
+                    j += 1
+                if node is not None and type(node) is not dict \
+                        and node != 'mouse':
+                    append(node)
+                    i = j
+                    continue
+            elif narrow and code < 256:
+                append(chr(code))
+                i += 1
+                continue
+
+            # anything else goes the long way
+            rest = codes[i:]
+            try:
+                run, rest = escape.process_keyqueue(rest, more_available)
+            except escape.MoreInputRequired:
+                self.pending = codes[i:]
+                break
+            keys.extend(run)
+            i = n - len(rest)
+        return keys
@@ -5,6 +5,8 @@ from misc import Misc
 
 class Label(Misc):
 
+    __slots__ = ('_text',)
+
     def __init__(self, text=""):
         super(Label, self).__init__()
         self._text = text
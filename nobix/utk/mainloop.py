@@ -2,7 +2,8 @@
 
 import select
 import time
-import heapq
+
+from ulib import TimerQueue, monotonic
 
 
 PIPE_BUFFER_READ_SIZE = 4096
@@ -188,7 +189,7 @@ class SelectEventLoop(object):
     """
 
     def __init__(self):
-        self._alarms = []
+        self._alarms = TimerQueue()
         self._watch_files = {}
         self._idle_handle = 0
         self._idle_callbacks = {}
@@ -204,9 +205,7 @@ class SelectEventLoop(object):
         seconds -- floating point time to wait before calling callback
         callback -- function to call from event loop
         """
-        tm = time.time() + seconds
-        heapq.heappush(self._alarms, (tm, callback))
-        return (tm, callback)
+        return self._alarms.add(monotonic() + seconds, callback)
 
     def remove_alarm(self, handle):
         """
@@ -214,12 +213,7 @@ class SelectEventLoop(object):
 
         Returns True if the alarm exists, False otherwise
         """
-        try:
-            self._alarms.remove(handle)
-            heapq.heapify(self._alarms)
-            return True
-        except ValueError:
-            return False
+        return self._alarms.remove(handle)
 
     def watch_file(self, fd, callback):
         """
@@ -297,16 +291,15 @@ class SelectEventLoop(object):
         A single iteration of the event loop
         """
         fds = self._watch_files.keys()
-        if self._alarms or self._did_something:
-            if self._alarms:
-                tm = self._alarms[0][0]
-                timeout = max(0, tm-time.time())
-            if self._did_something and (not self._alarms or timeout > 0):
+        tm = self._alarms.next_deadline()
+        if tm is not None or self._did_something:
+            if tm is not None:
+                timeout = max(0, tm-monotonic())
+            if self._did_something and (tm is None or timeout > 0):
                 timeout = 0
                 tm = 'idle'
             ready, w, err = select.select(fds, [], fds, timeout)
         else:
-            tm = None
             ready, w, err = select.select(fds, [], fds)
 
         if not ready:
@@ -315,9 +308,12 @@ class SelectEventLoop(object):
                 self._did_something = False
             elif tm is not None:
                 # must have been a timeout
-                tm, alarm_callback = self._alarms.pop(0)
-                alarm_callback()
-                self._did_something = True
+                now = monotonic()
+                timer = self._alarms.pop_due(now)
+                while timer is not None:
+                    timer.callback()
+                    self._did_something = True
+                    timer = self._alarms.pop_due(now)
 
         for fd in ready:
             self._watch_files[fd]()
@@ -326,8 +322,8 @@ class SelectEventLoop(object):
     def events_pending(self):
         fds = self._watch_files.keys()
         timeout = -1
-        if self._alarms:
-            tm = self._alarms[0][0]
-            timeout = max(0, tm-time.time())
+        tm = self._alarms.next_deadline()
+        if tm is not None:
+            timeout = max(0, tm-monotonic())
         ready, w, err = select.select(fds, [], fds, 0)
         return bool(ready or timeout) or self._did_something
@@ -11,6 +11,8 @@ from widget import Widget
 
 class Misc(Widget):
 
+    __slots__ = ('_xalign', '_yalign', '_xpad', '_ypad')
+
     def __init__(self):
         super(Misc, self).__init__()
         self._xalign = 0.5
@@ -21,6 +21,8 @@
 
 import sys
 import os
+import io
+import errno
 import fcntl
 import select
 import struct
@@ -36,10 +38,63 @@ from urwid.compat import B, bytes, PYTHON3
 from attr import AttrSpec, UNPRINTABLE_TRANS_TABLE
 from terminal import RealTerminal
 from screen import ScreenError, BaseScreen
+from decoder import InputDecoder
+import ulib
 
 
 _term_files = (sys.stdout, sys.stdin)
 
+# bytes read from the terminal input with a single read call
+INPUT_BUFFER_SIZE = 4096
+
+_DEFAULT_ATTR = AttrSpec('default', 'default')
+
+
+def _run_width(cs, run):
+    """Return the screen columns used by a rendered text run."""
+    if cs is not None:
+        return len(run)
+    return util.calc_width(run, 0, len(run))
+
+def _common_prefix(run, old_run, cs):
+    """
+    Return the length of the common start of two runs, stopping at a
+    character boundary.
+    """
+    n = min(len(run), len(old_run))
+    i = 0
+    while i < n and run[i] == old_run[i]:
+        i += 1
+    if cs is None and util.get_encoding_mode() != 'narrow':
+        while 0 < i < len(run) and ord(run[i:i+1]) > 127:
+            i -= 1
+    return i
+
+def _common_suffix(run, old_run, cs):
+    """
+    Return the length of the common end of two runs, stopping at a
+    character boundary.
+    """
+    n = min(len(run), len(old_run))
+    i = 0
+    while i < n and run[-1-i] == old_run[-1-i]:
+        i += 1
+    if cs is None and util.get_encoding_mode() != 'narrow':
+        k = len(run)
+        while 0 < i < k and ord(run[k-i:k-i+1]) > 127:
+            i -= 1
+    return i
+
+def _min_timeout(timeout, wait):
+    """
+    Return the shortest of two timeouts where None means forever.
+    """
+    if timeout is None:
+        return wait
+    if wait is None:
+        return timeout
+    return min(timeout, wait)
+
 class Screen(BaseScreen, RealTerminal):
     """
     Direct terminal UI implementation.
@@ -53,6 +108,8 @@ class Screen(BaseScreen, RealTerminal):
         super(Screen, self).__init__()
         self._screen_buf = None
         self._resized = False
+        self._resize_time = 0
+        self._cols_rows = None
         self._setup_G1_done = False
         self._rows_used = None
         self._cy = 0
@@ -64,31 +121,67 @@ class Screen(BaseScreen, RealTerminal):
         fcntl.fcntl(self._resize_pipe_rd, fcntl.F_SETFL, os.O_NONBLOCK)
 
         self._pal_escape = {}
+        # escape sequences by AttrSpec value and for undefined attributes
+        self._escape_cache = {}
+        self._undefined_attrs = {}
 
         self.colors = 16 # FIXME: detect this
-        self.has_underline = True # FIXME: detect this
-        self.bright_is_bold = os.environ.get('TERM', None) != 'xterm'
+        self._has_underline = True # FIXME: detect this
+        self._bright_is_bold = os.environ.get('TERM', None) != 'xterm'
 
         self._keyqueue = []
-        self.prev_input_resize = 0
         self._screen_buf_canvas = None
         self.maxrow = None
         self.gpm_mev = None
         self.gpm_event_pending = False
         self.last_bstate = 0
         self.use_alternate_buffer = True
+        # only repaint what changed since the last frame
+        self.damage_tracking = True
+        # bytes and write calls used by the last draw_screen()
+        self.last_frame_bytes = 0
+        self.last_frame_writes = 0
+        # read calls and bytes read from the terminal input
+        self.input_reads = 0
+        self.input_bytes = 0
+        self._input_reader = None
+        self._input_buffer = bytearray(INPUT_BUFFER_SIZE)
+        self._decoder = InputDecoder()
+        # printable keys of the current burst already delivered and those
+        # held back while they may be part of a scan, and the shortest
+        # code reported as a ('scan', code, typed) event
+        self._scan_typed = []
+        self._scan_keys = []
+        self._scan_time = 0
+        self.scan_min_length = 4
 
         self.register_palette_entry(None, 'default', 'default')
         self.set_input_timeouts()
 
     def do_update_palette_entry(self, name, *attrspecs):
         # copy the attribute to a dictionary containing the escape sequences
-        self._pal_escape[name] = self._attrspec_to_escape(
+        esc = self._attrspec_to_escape(
             attrspecs[{16: 0, 1: 1, 88: 2, 256: 3}[self.colors]]
         )
+        old = self._pal_escape.get(name, self._undefined_attrs.get(name))
+        self._pal_escape[name] = esc
+        self._undefined_attrs.pop(name, None)
+        if old is not None and old != esc and self._screen_buf:
+            # the rows using the entry are repainted by the next frame
+            for y, row in enumerate(self._screen_buf):
+                for a, cs, run in row:
+                    if a == name:
+                        self._screen_buf[y] = []
+                        break
+            self._screen_buf_canvas = None
+
+    bright_is_bold = property(lambda self: self._bright_is_bold,
+        lambda self, value: self.set_terminal_properties(bright_is_bold=value))
+    has_underline = property(lambda self: self._has_underline,
+        lambda self, value: self.set_terminal_properties(has_underline=value))
 
     def set_input_timeouts(self, max_wait=None, complete_wait=0.125,
-        resize_wait=0.125):
+        resize_wait=0.125, scan_wait=0.03):
         """
         Set the get_input timeout values.  All values are in floating
         point numbers of seconds.
@@ -98,10 +191,16 @@ class Screen(BaseScreen, RealTerminal):
         complete_wait -- amount of time in seconds to wait when
             get_input detects an incomplete escape sequence at the
             end of the available input
-        resize_wait -- amount of time in seconds to wait for more input
-            after receiving two screen resize requests in a row to
-            stop Urwid from consuming 100% cpu during a gradual
-            window resize operation
+        resize_wait -- amount of time in seconds the terminal size
+            must stay unchanged before 'window resize' is reported, so
+            a gradual window resize operation is handled as a single
+            resize and a single repaint
+        scan_wait -- longest time in seconds between two keys sent by
+            a barcode scanner, a burst of at least scan_min_length
+            printable keys this fast terminated by 'enter' is returned
+            as a single ('scan', code, typed) event, disabled if None.
+            A key arriving on its own is delivered at once, typed is the
+            number of leading characters of code delivered that way
         """
         self.max_wait = max_wait
         if max_wait is not None:
@@ -111,12 +210,14 @@ class Screen(BaseScreen, RealTerminal):
                 self._next_timeout = min(self._next_timeout, self.max_wait)
         self.complete_wait = complete_wait
         self.resize_wait = resize_wait
+        self.scan_wait = scan_wait
 
     def _sigwinch_handler(self, signum, frame):
         if not self._resized:
             os.write(self._resize_pipe_wr, B('R'))
         self._resized = True
-        self._screen_buf = None
+        self._resize_time = ulib.monotonic()
+        self._cols_rows = None
 
     def signal_init(self):
         """
@@ -180,6 +281,11 @@ class Screen(BaseScreen, RealTerminal):
             self._old_termios_settings = termios.tcgetattr(fd)
             tty.setcbreak(fd)
 
+        self._cols_rows = None
+        self._input_reader = io.FileIO(fd, 'r', closefd=False)
+        self._scan_typed = []
+        self._scan_keys = []
+        self._decoder.reset()
         self.signal_init()
         self._input_iter = self._run_input_iter()
         self._next_timeout = self.max_wait
@@ -205,7 +311,7 @@ class Screen(BaseScreen, RealTerminal):
             move_cursor = escape.RESTORE_NORMAL_BUFFER
         elif self.maxrow is not None:
             move_cursor = escape.set_cursor_position(0, self.maxrow)
-        self._term_output_file.write(self._attrspec_to_escape(AttrSpec('', ''))
+        self._term_output_file.write(self._attrspec_to_escape(_DEFAULT_ATTR)
             + escape.SI
             + escape.MOUSE_TRACKING_OFF
             + escape.SHOW_CURSOR
@@ -283,28 +389,12 @@ class Screen(BaseScreen, RealTerminal):
         self._wait_for_input_ready(self._next_timeout)
         self._next_timeout, keys, raw = self._input_iter.next()
 
-        # Avoid pegging CPU at 100% when slowly resizing
-        if keys == ['window resize'] and self.prev_input_resize:
-            while True:
-                self._wait_for_input_ready(self.resize_wait)
-                self._next_timeout, keys, raw2 = \
-                    self._input_iter.next()
-                raw += raw2
-                #if not keys:
-                #    keys, raw2 = self._get_input( 
-                #        self.resize_wait)
-                #    raw += raw2
-                if keys != ['window resize']:
-                    break
-            if keys[-1:] != ['window resize']:
-                keys.append('window resize')
-
-        if keys == ['window resize']:
-            self.prev_input_resize = 2
-        elif self.prev_input_resize == 2 and not keys:
-            self.prev_input_resize = 1
-        else:
-            self.prev_input_resize = 0
+        # while the terminal size settles or a scan may be coming in,
+        # wait for it unless there is other input to return
+        while (self._resized or self._scan_keys) and not keys:
+            self._wait_for_input_ready(self._next_timeout)
+            self._next_timeout, keys, raw2 = self._input_iter.next()
+            raw += raw2
 
         if raw_keys:
             return keys, raw
@@ -348,39 +438,101 @@ class Screen(BaseScreen, RealTerminal):
             except OSError:
                 pass
 
+        decoder = self._decoder
         while True:
-            processed = []
-            codes = self._get_gpm_codes() + \
+            original_codes = self._get_gpm_codes() + \
                 self._get_keyboard_codes()
+            processed = decoder.feed(original_codes)
 
-            original_codes = codes
-            try:
-                while codes:
-                    run, codes = escape.process_keyqueue(
-                        codes, True)
-                    processed.extend(run)
-            except escape.MoreInputRequired:
-                k = len(original_codes) - len(codes)
-                yield (self.complete_wait, processed,
+            if decoder.pending:
+                k = len(original_codes) - len(decoder.pending)
+                processed, wait = self._detect_scan(processed)
+                yield (_min_timeout(self.complete_wait, wait), processed,
                     original_codes[:k])
                 empty_resize_pipe()
-                original_codes = codes
-                processed = []
 
-                codes += self._get_keyboard_codes() + \
+                codes = self._get_keyboard_codes() + \
                     self._get_gpm_codes()
-                while codes:
-                    run, codes = escape.process_keyqueue(
-                        codes, False)
-                    processed.extend(run)
+                original_codes = decoder.pending + codes
+                processed = decoder.feed(codes, False)
+
+            processed, wait = self._detect_scan(processed)
 
             if self._resized:
-                processed.append('window resize')
+                # report the resize once the size stopped changing for
+                # resize_wait seconds, however many signals came in
+                settle = self._resize_time + self.resize_wait - \
+                    ulib.monotonic()
+                if settle > 0:
+                    yield (_min_timeout(settle, wait), processed,
+                        original_codes)
+                    empty_resize_pipe()
+                    continue
                 self._resized = False
+                self._screen_buf = None
+                processed.append('window resize')
+                self.queue_draw()
 
-            yield (self.max_wait, processed, original_codes)
+            yield (_min_timeout(self.max_wait, wait), processed,
+                original_codes)
             empty_resize_pipe()
 
+    def _detect_scan(self, keys):
+        """
+        Return a (keys, wait) tuple with the keys that can be delivered
+        now, replacing a burst of printable keys terminated by 'enter'
+        with a ('scan', code, typed) event.
+
+        A printable key arriving on its own with no burst going on is
+        delivered at once, so typing gets no extra latency.  Keys coming
+        faster than scan_wait after it, or together with it, are held back
+        while they may be part of a scan, wait is the time in seconds after
+        which they are delivered as typed keys, or None.
+        """
+        typed = self._scan_typed
+        held = self._scan_keys
+        if self.scan_wait is None:
+            self._scan_typed = []
+            if held:
+                keys = held + keys
+                self._scan_keys = []
+            return keys, None
+
+        now = ulib.monotonic()
+        processed = []
+        if (typed or held) and now - self._scan_time > self.scan_wait:
+            # too slow for a scanner, somebody typed them
+            processed.extend(held)
+            typed = []
+            held = []
+        last = len(keys) - 1
+        for i, key in enumerate(keys):
+            if len(key) == 1:
+                if typed or held or i < last:
+                    held.append(key)
+                else:
+                    processed.append(key)
+                    typed.append(key)
+            elif key == 'enter' and \
+                    len(typed) + len(held) >= self.scan_min_length:
+                processed.append(('scan', ''.join(typed + held), len(typed)))
+                typed = []
+                held = []
+            else:
+                processed.extend(held)
+                processed.append(key)
+                typed = []
+                held = []
+
+        self._scan_typed = typed
+        self._scan_keys = held
+        if typed or held:
+            if keys:
+                self._scan_time = now
+        if not held:
+            return processed, None
+        return processed, self._scan_time + self.scan_wait - now
+
     def _fake_input_iter(self):
         """
         This generator is a placeholder for when the screen is stopped
@@ -390,14 +542,40 @@ class Screen(BaseScreen, RealTerminal):
             yield (self.max_wait, [], [])
 
     def _get_keyboard_codes(self):
+        """
+        Return the codes of all the input available on the terminal,
+        read in as few calls as the input buffer allows.
+        """
         codes = []
         while True:
-            code = self._getch_nodelay()
-            if code < 0:
+            ready = self._wait_for_input_ready(0)
+            if self.gpm_mev is not None:
+                if self.gpm_mev.stdout.fileno() in ready:
+                    self.gpm_event_pending = True
+            if self._term_input_file.fileno() not in ready:
+                break
+            try:
+                n = self._input_reader.readinto(self._input_buffer)
+            except IOError as e:
+                if e.args[0] != errno.EINTR:
+                    raise
+                continue
+            if not n:
+                break
+            self.input_reads += 1
+            self.input_bytes += n
+            codes.extend(self._input_buffer[:n])
+            if n < len(self._input_buffer):
                 break
-            codes.append(code)
         return codes
 
+    @property
+    def input_bytes_per_read(self):
+        """Average number of bytes returned by each terminal read."""
+        if not self.input_reads:
+            return 0.0
+        return float(self.input_bytes) / self.input_reads
+
     def _get_gpm_codes(self):
         codes = []
         try:
@@ -428,15 +606,6 @@ class Screen(BaseScreen, RealTerminal):
                     break
         return ready
 
-    def _getch(self, timeout):
-        ready = self._wait_for_input_ready(timeout)
-        if self.gpm_mev is not None:
-            if self.gpm_mev.stdout.fileno() in ready:
-                self.gpm_event_pending = True
-        if self._term_input_file.fileno() in ready:
-            return ord(os.read(self._term_input_file.fileno(), 1))
-        return -1
-
     def _encode_gpm_event( self ):
         self.gpm_event_pending = False
         s = self.gpm_mev.stdout.readline().decode('ascii')
@@ -499,15 +668,15 @@ class Screen(BaseScreen, RealTerminal):
         self.last_bstate = next
         return l
 
-    def _getch_nodelay(self):
-        return self._getch(0)
-
     def get_cols_rows(self):
         """Return the terminal dimensions (num columns, num rows)."""
-        buf = fcntl.ioctl(0, termios.TIOCGWINSZ, ' '*4)
-        y, x = struct.unpack('hh', buf)
-        self.maxrow = y
-        return x, y
+        # the size is only read again after a SIGWINCH
+        if self._cols_rows is None:
+            buf = fcntl.ioctl(0, termios.TIOCGWINSZ, ' '*4)
+            y, x = struct.unpack('hh', buf)
+            self.maxrow = y
+            self._cols_rows = x, y
+        return self._cols_rows
 
     def _setup_G1(self):
         """
@@ -529,9 +698,14 @@ class Screen(BaseScreen, RealTerminal):
         """Paint screen with rendered canvas."""
         assert self._started
 
+        if self._resized:
+            # don't paint at a size that is still changing, the resize
+            # is reported and repainted once it settles
+            return
+
         screen_size = self.get_cols_rows()
 
-        r = self._toplevels[-1].render(screen_size, focus=True)
+        r = self.render_toplevels(screen_size)
         maxcol, maxrow = screen_size
 
         assert maxrow == r.rows()
@@ -546,7 +720,8 @@ class Screen(BaseScreen, RealTerminal):
             # handle resize before trying to draw screen
             return
 
-        o = [escape.HIDE_CURSOR, self._attrspec_to_escape(AttrSpec('',''))]
+        default_escape = self._attrspec_to_escape(_DEFAULT_ATTR)
+        o = [escape.HIDE_CURSOR, default_escape]
 
         def partial_display():
             # returns True if the screen is in partial display mode
@@ -556,7 +731,8 @@ class Screen(BaseScreen, RealTerminal):
         if not partial_display():
             o.append(escape.CURSOR_HOME)
 
-        if self._screen_buf:
+        if (self.damage_tracking and self._screen_buf and
+            len(self._screen_buf) == maxrow):
             osb = self._screen_buf
         else:
             osb = []
@@ -593,22 +769,26 @@ class Screen(BaseScreen, RealTerminal):
                 return False
             return True
 
+        pal_escape = self._pal_escape
+        undefined_attrs = self._undefined_attrs
+
         def attr_to_escape(a):
-            if a in self._pal_escape:
-                return self._pal_escape[a]
+            if a in pal_escape:
+                return pal_escape[a]
             elif isinstance(a, AttrSpec):
                 return self._attrspec_to_escape(a)
-            # undefined attributes use default/default
-            # TODO: track and report these
-            return self._attrspec_to_escape(
-                AttrSpec('default','default'))
+            elif a not in undefined_attrs:
+                # undefined attributes use default/default, remember them
+                # so they can be reported
+                undefined_attrs[a] = default_escape
+            return undefined_attrs[a]
 
         ins = None
         o.append(set_cursor_home())
         cy = 0
         for row in r.content():
             y += 1
-            if False and osb and osb[y] == row:
+            if osb and osb[y] == row:
                 # this row of the screen buffer matches what is
                 # currently displayed, so we can skip this line
                 sb.append( osb[y] )
@@ -623,14 +803,29 @@ class Screen(BaseScreen, RealTerminal):
                     continue
                 self._rows_used = y
 
-            if y or partial_display():
-                o.append(set_cursor_position(0, y))
+            last_row = y == maxrow-1
+            x = 0
+            if osb:
+                # only repaint the columns that changed
+                x, damaged, to_end = self._row_damage(osb[y], row)
+                if last_row and to_end:
+                    # the bottom right character has to be slid into
+                    # place, so the whole row must be written
+                    x = 0
+                else:
+                    row = damaged
+                    last_row = False
+                if not row:
+                    continue
+
+            if x or y or partial_display():
+                o.append(set_cursor_position(x, y))
             # after updating the line we will be just over the
             # edge, but terminals still treat this as being
             # on the same line
             cy = y
 
-            if y == maxrow-1:
+            if last_row:
                 row, back, ins = self._last_row(row)
 
             first = True
@@ -679,29 +874,102 @@ class Screen(BaseScreen, RealTerminal):
             o += [set_cursor_position(x, y),
                 escape.SHOW_CURSOR  ]
             self._cy = y
+        else:
+            self._cy = cy
 
         if self._resized:
             # handle resize before trying to draw screen
             return
-        try:
-            k = 0
-            for l in o:
-                if isinstance(l, bytes) and PYTHON3:
-                    l = l.decode('utf-8')
-                self._term_output_file.write(l)
-                k += len(l)
-                if k > 1024:
-                    self._term_output_file.flush()
-                    k = 0
-            self._term_output_file.flush()
-        except IOError as e:
-            # ignore interrupted syscall
-            if e.args[0] != 4:
-                raise
+        if PYTHON3:
+            o = [l if isinstance(l, bytes) else l.encode('utf-8')
+                 for l in o]
+        self._write_frame(B('').join(o))
+        self._frame_written()
 
         self._screen_buf = sb
         self._screen_buf_canvas = r
 
+    def _write_frame(self, data):
+        """
+        Write a whole frame to the terminal, with a single write on the
+        terminal file descriptor unless the write is cut short or
+        interrupted.
+        """
+        self.last_frame_bytes = len(data)
+        self.last_frame_writes = 0
+        # anything written through the file object must go out first
+        self._term_output_file.flush()
+        try:
+            fd = self._term_output_file.fileno()
+        except (AttributeError, IOError, ValueError):
+            # not backed by a file descriptor
+            if PYTHON3:
+                data = data.decode('utf-8')
+            self._term_output_file.write(data)
+            self._term_output_file.flush()
+            self.last_frame_writes = 1
+            return
+
+        pending = memoryview(data)
+        while len(pending):
+            try:
+                n = os.write(fd, pending)
+            except OSError as e:
+                if e.errno == errno.EINTR:
+                    continue
+                if e.errno != errno.EAGAIN:
+                    raise
+                select.select([], [fd], [])
+                continue
+            self.last_frame_writes += 1
+            pending = pending[n:]
+
+    def _row_damage(self, old_row, row):
+        """Compare a row with the one currently displayed and return
+        (col, segments, to_end) where segments is the smallest run of
+        (attr, cs, text) segments that has to be repainted starting at
+        screen column col, and to_end is True if that run reaches the
+        last column of the screen.
+
+        Both rows span the whole screen width, so whatever is left on
+        either side of the run is already in place on the terminal.
+        """
+        n = min(len(old_row), len(row))
+        start = col = 0
+        while start < n and old_row[start] == row[start]:
+            col += _run_width(row[start][1], row[start][2])
+            start += 1
+        end, old_end = len(row), len(old_row)
+        while (end > start and old_end > start and
+            old_row[old_end-1] == row[end-1]):
+            end -= 1
+            old_end -= 1
+        segments = row[start:end]
+        to_end = end == len(row)
+        if not segments or old_end == start:
+            return col, segments, to_end
+
+        # trim the unchanged text at both ends of the run
+        a, cs, run = segments[0]
+        head = 0
+        if old_row[start][:2] == (a, cs):
+            head = _common_prefix(run, old_row[start][2], cs)
+        a, cs, last = segments[-1]
+        tail = 0
+        if old_row[old_end-1][:2] == (a, cs):
+            tail = _common_suffix(last, old_row[old_end-1][2], cs)
+        if len(segments) == 1:
+            tail = max(0, min(tail, len(last) - head))
+        if head:
+            a, cs, run = segments[0]
+            col += _run_width(cs, run[:head])
+            segments[0] = (a, cs, run[head:])
+        if tail:
+            a, cs, last = segments[-1]
+            segments[-1] = (a, cs, last[:len(last)-tail])
+            to_end = False
+        return col, segments, to_end
+
     def _last_row(self, row):
         """On the last row we need to slide the bottom right character
         into place. Calculate the new line, attr and an insert sequence
@@ -768,6 +1036,11 @@ class Screen(BaseScreen, RealTerminal):
         >>> a2e(s.AttrSpec('#fea,underline', '#d0d'))
         '\\x1b[0;38;5;229;4;48;5;164m'
         """
+        # the sequence only depends on the packed value and on the
+        # terminal properties, setting any of them flushes the cache
+        if a._value in self._escape_cache:
+            return self._escape_cache[a._value]
+
         if a.foreground_high:
             fg = "38;5;%d" % a.foreground_number
         elif a.foreground_basic:
@@ -792,7 +1065,9 @@ class Screen(BaseScreen, RealTerminal):
                 bg = "%d" % (a.background_number + 40)
         else:
             bg = "49"
-        return escape.ESC + "[0;%s;%s%sm" % (fg, st, bg)
+        esc = escape.ESC + "[0;%s;%s%sm" % (fg, st, bg)
+        self._escape_cache[a._value] = esc
+        return esc
 
     def set_terminal_properties(self, colors=None, bright_is_bold=None,
         has_underline=None):
@@ -819,13 +1094,15 @@ class Screen(BaseScreen, RealTerminal):
             return
 
         self.colors = colors
-        self.bright_is_bold = bright_is_bold
-        self.has_underline = has_underline
+        self._bright_is_bold = bright_is_bold
+        self._has_underline = has_underline
 
         self.clear()
         self._pal_escape = {}
+        self._escape_cache = {}
+        self._undefined_attrs = {}
         for p,v in self._palette.items():
-            self._on_update_palette_entry(p, *v)
+            self.do_update_palette_entry(p, *v)
 
     def reset_default_terminal_palette(self):
         """
@@ -19,6 +19,8 @@
 # Urwid web site: http://excess.org/urwid/
 
 
+from urwid.canvas import CanvasOverlay, SolidCanvas
+
 from attr import AttrSpec, DEFAULT
 from signals import MetaSignals
 import ulib
@@ -37,7 +39,7 @@ class BaseScreen(object):
     Base class for Screen classes (raw_display.Screen, .. etc)
     """
     __metaclass__ = MetaSignals
-    signals = ['start', 'stop', 'udpate-palette-entry', 'clear', 'draw-screen',
+    signals = ['start', 'stop', 'update-palette-entry', 'clear', 'draw-screen',
                'input-descriptors-changed']
 
     def __init__(self):
@@ -45,7 +47,18 @@ class BaseScreen(object):
         self._palette = {}
         self._started = False
         self._update_idle = None
+        self._update_timeout = None
         self._toplevels = []
+        # redraws are coalesced and sent out at most max_fps times per
+        # second (no limit if None), see queue_draw()
+        self.max_fps = None
+        self.frames_requested = 0
+        self.frames_emitted = 0
+        self._last_frame_time = None
+        # (left, top, cols, rows) of the toplevels not covering the screen
+        self._toplevel_rects = {}
+        # (size, layers, canvas) of the last composited frame
+        self._composite = None
 
     started = property(lambda self: self._started)
 
@@ -191,6 +204,15 @@ class BaseScreen(object):
         """
         self.emit("draw-screen")
 
+    def _frame_written(self):
+        """
+        Called by the screen implementations after each frame actually
+        written to the terminal, draws that found nothing to paint don't
+        count.
+        """
+        self.frames_emitted += 1
+        self._last_frame_time = ulib.monotonic()
+
     def draw_screen_idle(self):
         """
         Call :meth:`draw_screen` in idle update
@@ -199,22 +221,120 @@ class BaseScreen(object):
         self._update_idle = None
         return False
 
-    def queue_draw(self):
+    def _draw_screen_timeout(self):
+        self._update_timeout = None
+        self._update_idle = ulib.idle_add(self.draw_screen_idle,
+                                          priority=PRIORITY_REDRAW)
+        return False
+
+    def queue_draw(self, immediate=False):
+        """
+        Signal this Screen to redraw in the next idle update, or once
+        1/max_fps seconds passed since the last frame.  Requests made
+        while a redraw is pending are served by it.
+
+        immediate -- redraw right now regardless of max_fps, for latency
+            sensitive updates like echoing typed input
+        """
+        self.frames_requested += 1
+        if immediate:
+            if self._update_idle:
+                ulib.idle_remove(self._update_idle)
+                self._update_idle = None
+            if self._update_timeout:
+                ulib.timeout_remove(self._update_timeout)
+                self._update_timeout = None
+            self.draw_screen()
+            return
+        if self._update_idle or self._update_timeout:
+            return
+        if self.max_fps and self._last_frame_time is not None:
+            wait = self._last_frame_time + 1.0 / self.max_fps - \
+                ulib.monotonic()
+            if wait > 0:
+                self._update_timeout = ulib.timeout_add_seconds(
+                    wait, self._draw_screen_timeout)
+                return
+        self._update_idle = ulib.idle_add(self.draw_screen_idle,
+                                          priority=PRIORITY_REDRAW)
+
+    def render_toplevels(self, size):
+        """
+        Return the canvas of all the toplevels overlaid from the bottom one
+        up at their positions, the topmost one having the focus.
+
+        Unchanged widgets return the canvas urwid's CanvasCache kept for
+        them, so the composited canvas is reused while every layer renders
+        to the same canvas at the same position.
         """
-        Signal this Screen to redraw in the next idle update
+        maxcol, maxrow = size
+        layers = []
+        last = len(self._toplevels) - 1
+        for i, widget in enumerate(self._toplevels):
+            rect = self._toplevel_rects.get(widget)
+            if rect is None:
+                left, top, cols, rows = 0, 0, maxcol, maxrow
+            else:
+                left, top, cols, rows = rect
+                cols = min(cols, maxcol - left)
+                rows = min(rows, maxrow - top)
+                if cols <= 0 or rows <= 0:
+                    continue
+            canvas = widget.render((cols, rows), focus=i == last)
+            layers.append((canvas, left, top))
+
+        if len(layers) == 1 and self._toplevel_rects.get(
+                self._toplevels[0]) is None:
+            return layers[0][0]
+
+        cached = self._composite
+        if (cached is not None and cached[0] == size and
+            len(cached[1]) == len(layers)):
+            for (canvas, left, top), (old, old_left, old_top) in zip(
+                    layers, cached[1]):
+                if canvas is not old or (left, top) != (old_left, old_top):
+                    break
+            else:
+                return cached[2]
+
+        if layers and layers[0][0].cols() == maxcol and \
+                layers[0][0].rows() == maxrow:
+            composite = layers[0][0]
+            overlays = layers[1:]
+        else:
+            composite = SolidCanvas(' ', maxcol, maxrow)
+            overlays = layers
+        for canvas, left, top in overlays:
+            composite = CanvasOverlay(canvas, composite, left, top)
+        self._composite = (size, layers, composite)
+        return composite
+
+    def add_toplevel(self, widget, rect=None):
         """
-        if not self._update_idle:
-            self._update_idle = ulib.idle_add(self.draw_screen_idle,
-                                              priority=PRIORITY_REDRAW)
+        Add widget on top of the other toplevels.
 
-    def add_toplevel(self, widget):
+        rect -- (left, top, cols, rows) of the screen area the widget
+            covers, the whole screen if None
+        """
         if widget not in self._toplevels:
             self._toplevels.append(widget)
-            self.queue_draw()
+            self.move_toplevel(widget, rect)
+
+    def move_toplevel(self, widget, rect):
+        """
+        Set the (left, top, cols, rows) screen area covered by toplevel
+        widget, the whole screen if rect is None.
+        """
+        if rect is None:
+            self._toplevel_rects.pop(widget, None)
+        else:
+            self._toplevel_rects[widget] = tuple(rect)
+        self.queue_draw()
 
     def remove_toplevel(self, widget):
         if widget in self._toplevels:
             self._toplevels.remove(widget)
+            self._toplevel_rects.pop(widget, None)
             self.queue_draw()
 
     def raise_toplevel(self, widget):
@@ -1,49 +1,139 @@
 # -*- coding: utf-8 -*-
 
+import types
+import weakref
+
+
 class MetaSignals(type):
     """
     Register the list of signals in the class variable signals, including
     signals in superclasses.
     """
     def __init__(cls, name, bases, d):
-        signals = d.get('signals', [])
+        signals = list(d.get('signals', ()))
         for superclass in cls.__bases__:
-            signals.extend(getattr(superclass, 'signals', []))
-        signals = tuple(set(signals))
-        d['signals'] = signals
-        _make_signals_support(cls, signals)
+            for signal in getattr(superclass, 'signals', ()):
+                if signal not in signals:
+                    signals.append(signal)
+        cls.signals = tuple(signals)
+        _make_signals_support(cls, cls.signals)
         super(MetaSignals, cls).__init__(name, bases, d)
 
 
+def _signal_handler(cls, name):
+    """
+    Return the do_<name> class handler of signal name as a function taking
+    the instance as first argument, or None if cls doesn't define one.
+    """
+    attr = 'do_{}'.format(name.replace('-', '_').lower())
+    for klass in cls.__mro__:
+        if attr in klass.__dict__:
+            handler = klass.__dict__[attr]
+            if isinstance(handler, types.FunctionType):
+                return handler
+            return lambda self, *args: getattr(self, attr)(*args)
+    return None
+
+
+class _WeakCallback(object):
+    """
+    Callback connected with weak=True, holds a weak reference to the
+    function or to the instance of a bound method.
+    """
+    __slots__ = ('_ref', '_func')
+
+    def __init__(self, callback):
+        obj = getattr(callback, '__self__', None)
+        if obj is not None:
+            self._ref = weakref.ref(obj)
+            self._func = callback.__func__
+        else:
+            self._ref = weakref.ref(callback)
+            self._func = None
+
+    def get(self):
+        """
+        Return the callback, or None if it was garbage collected.
+        """
+        obj = self._ref()
+        if obj is None or self._func is None:
+            return obj
+        return types.MethodType(self._func, obj)
+
+
+def _live_callbacks(callbacks):
+    return tuple([(callback, data) for callback, data in callbacks
+                  if callback.__class__ is not _WeakCallback or
+                  callback.get() is not None])
+
+def _connect(self, name, callback, data=None, weak=False):
+    if not name in self._signal_handlers:
+        raise NameError("No such signal {0} for object {1}".format(name, self))
+    registry = self._signal_callbacks
+    if registry is None:
+        registry = self._signal_callbacks = {}
+    if weak:
+        callback = _WeakCallback(callback)
+    # callbacks are kept in tuples that are replaced on change, so emit
+    # can iterate them while callbacks connect or disconnect
+    registry[name] = _live_callbacks(registry.get(name, ())) + \
+        ((callback, data),)
+
+def _disconnect(self, name, callback, data=None):
+    registry = self._signal_callbacks
+    if not registry or name not in registry:
+        return
+    callbacks = []
+    for connected, connected_data in registry[name]:
+        target = connected
+        if connected.__class__ is _WeakCallback:
+            target = connected.get()
+            if target is None:
+                continue
+        if callback is not None and target == callback and \
+                connected_data == data:
+            callback = None
+            continue
+        callbacks.append((connected, connected_data))
+    if callbacks:
+        registry[name] = tuple(callbacks)
+    else:
+        del registry[name]
+
+def _emit(self, name, *args):
+    handler = self._signal_handlers.get(name)
+    registry = self._signal_callbacks
+    callbacks = registry.get(name) if registry else None
+    if handler is None and not callbacks:
+        return False
+    result = False
+    if handler is not None:
+        result = bool(handler(self, *args))
+    if callbacks:
+        dead = False
+        for callback, data in callbacks:
+            if callback.__class__ is _WeakCallback:
+                callback = callback.get()
+                if callback is None:
+                    dead = True
+                    continue
+            if data is None:
+                result |= bool(callback(*args))
+            else:
+                result |= bool(callback(*(args + (data,))))
+        if dead and name in registry:
+            registry[name] = _live_callbacks(registry[name])
+    return result
+
+
 def _make_signals_support(cls, signals):
+    # the callbacks connected to each instance live in a dict allocated
+    # on its first connect()
+    if not hasattr(cls, '_signal_callbacks'):
+        cls._signal_callbacks = None
+    cls._signal_handlers = dict([(signame, _signal_handler(cls, signame))
+                                 for signame in signals])
 
-    def connect(self, name, callback, data=None):
-        if not name in self._registered_signals:
-            raise NameError("No such signal {0} for object {1}".format(name, self))
-        self._registered_signals[name].append((callback, data))
-
-    def disconnect(self, name, callback, data=None):
-        if name not in self._registered_signals:
-            return
-        if (callback, data) not in self._registered_signals[name]:
-            return
-        self._registered_signals[name].remove((callback, data))
-
-    def emit(self, name, *args):
-        result = False
-        pre_call = []
-        sname = 'do_{}'.format(name.replace('-', '_').lower())
-        if hasattr(self, sname) and callable(getattr(self, sname)):
-            pre_call = [(getattr(self, sname), None)]
-        for callback, data in pre_call + self._registered_signals.get(name, []):
-            args_copy = args
-            if data is not None:
-                args_copy = args + (data,)
-            result |= bool(callback(*args_copy))
-        return result
-
-    cls._registered_signals = dict([(signame, []) for signame in signals])
-
-    setattr(cls, 'connect', connect)
-    setattr(cls, 'disconnect', disconnect)
-    setattr(cls, 'emit', emit)
+    setattr(cls, 'connect', _connect)
+    setattr(cls, 'disconnect', _disconnect)
+    setattr(cls, 'emit', _emit)
@@ -1,6 +1,9 @@
 # -*- coding: utf-8 -*-
 
+import os
 import time
+import math
+import errno
 import select
 import heapq
 
@@ -10,62 +13,394 @@ PRIORITY_HIGH_IDLE    =  100
 PRIORITY_DEFAULT_IDLE =  200
 PRIORITY_LOW          =  300
 
-class MainContext(object):
+_PRIORITY_BANDS = (PRIORITY_HIGH, PRIORITY_DEFAULT, PRIORITY_HIGH_IDLE,
+                   PRIORITY_DEFAULT_IDLE, PRIORITY_LOW)
+
+def _priority_band(priority):
+    """
+    Returns the PRIORITY_* constant priority falls in.
+    """
+    band = PRIORITY_HIGH
+    for value in _PRIORITY_BANDS:
+        if priority < value:
+            break
+        band = value
+    return band
+
+
+def _clock_gettime_monotonic():
+    """
+    Returns a function reading CLOCK_MONOTONIC through clock_gettime(2),
+    for Pythons without :func:`time.monotonic`.
+    """
+    import ctypes
+    import ctypes.util
+
+    class timespec(ctypes.Structure):
+        _fields_ = [('tv_sec', ctypes.c_long), ('tv_nsec', ctypes.c_long)]
+
+    CLOCK_MONOTONIC = 1
+    librt = ctypes.CDLL(ctypes.util.find_library('rt') or 'librt.so.1',
+                        use_errno=True)
+    clock_gettime = librt.clock_gettime
+    clock_gettime.argtypes = [ctypes.c_int, ctypes.POINTER(timespec)]
+    ts = timespec()
+
+    def monotonic():
+        if clock_gettime(CLOCK_MONOTONIC, ctypes.byref(ts)) != 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err))
+        return ts.tv_sec + ts.tv_nsec * 1e-9
+    return monotonic
+
+# monotonic() returns the seconds of a clock that never goes backwards and
+# is not affected by system clock updates, only differences are meaningful
+try:
+    from time import monotonic
+except ImportError:
+    try:
+        monotonic = _clock_gettime_monotonic()
+    except (OSError, AttributeError):
+        # no clock_gettime, wall clock is all we have
+        monotonic = time.time
+
+
+class Timer(object):
+    """
+    A callback scheduled in a :class:`TimerQueue`.
+    """
+    __slots__ = ('queue', 'deadline', 'callback', 'active', 'interval',
+                 'scheduled')
+
+    def __init__(self, queue, deadline, callback):
+        self.queue = queue
+        self.deadline = deadline
+        self.callback = callback
+        self.active = True
+        # repeat interval and the time the timer was meant to fire at,
+        # used by repeating timeouts
+        self.interval = None
+        self.scheduled = deadline
+
+    def cancel(self):
+        """
+        Cancel the timer.
+
+        Returns ``True`` if the timer was still pending.
+        """
+        return self.queue.remove(self)
+
+
+class TimerQueue(object):
+    """
+    Heap of :class:`Timer` objects ordered by deadline. Timers sharing a
+    deadline keep the order they were added in.
+
+    Removed timers stay in the heap and are dropped when they reach the
+    top, or all at once when they outnumber the pending ones, so adding
+    and removing a timer are both O(log n).
+
+    The deadline may be any ordered key, :class:`MainContext` also keeps
+    its idle callbacks in a queue ordered by priority.
+    """
 
     def __init__(self):
-        self._alarms = []
+        self._heap = []
+        self._seq = 0
+        self._removed = 0
+
+    def __len__(self):
+        return len(self._heap) - self._removed
+
+    def add(self, deadline, callback):
+        """
+        Schedule callback at deadline.
+
+        Returns the :class:`Timer` handle.
+        """
+        timer = Timer(self, deadline, callback)
+        self._push(timer)
+        return timer
+
+    def restart(self, timer, deadline):
+        """
+        Schedule again a timer that already fired, keeping its handle.
+        """
+        assert timer.queue is self and not timer.active
+        timer.deadline = deadline
+        timer.active = True
+        self._push(timer)
+
+    def _push(self, timer):
+        heapq.heappush(self._heap, (timer.deadline, self._seq, timer))
+        self._seq += 1
+
+    def remove(self, timer):
+        """
+        Remove a pending timer.
+
+        Returns ``True`` if the timer was pending, ``False`` otherwise.
+        """
+        if timer.queue is not self or not timer.active:
+            return False
+        timer.active = False
+        self._removed += 1
+        if self._removed > 64 and self._removed > len(self._heap) // 2:
+            self._heap = [entry for entry in self._heap if entry[2].active]
+            heapq.heapify(self._heap)
+            self._removed = 0
+        return True
+
+    def _drop_removed(self):
+        heap = self._heap
+        while heap and not heap[0][2].active:
+            heapq.heappop(heap)
+            self._removed -= 1
+
+    def next_deadline(self):
+        """
+        Returns the deadline of the earliest pending timer or ``None``.
+        """
+        self._drop_removed()
+        if self._heap:
+            return self._heap[0][0]
+        return None
+
+    def pop(self):
+        """
+        Remove and return the earliest pending timer.
+        """
+        self._drop_removed()
+        timer = heapq.heappop(self._heap)[2]
+        timer.active = False
+        return timer
+
+    def pop_due(self, now):
+        """
+        Remove and return the earliest pending timer if its deadline is
+        not later than now, otherwise return ``None``.
+        """
+        deadline = self.next_deadline()
+        if deadline is None or deadline > now:
+            return None
+        return self.pop()
+
+
+class SelectBackend(object):
+    """
+    Wait for file descriptors with :func:`select.select`.
+    """
+
+    def __init__(self):
+        self._fds = set()
+
+    def register(self, fd):
+        self._fds.add(fd)
+
+    def unregister(self, fd):
+        self._fds.discard(fd)
+
+    def poll(self, timeout=None):
+        """
+        Wait up to *timeout* seconds, or forever if it is ``None``.
+
+        Returns the list of file descriptors ready for reading.
+        """
+        fds = list(self._fds)
+        try:
+            if timeout is None:
+                ready, w, err = select.select(fds, [], fds)
+            else:
+                ready, w, err = select.select(fds, [], fds, timeout)
+        except select.error as e:
+            if e.args[0] != errno.EINTR:
+                raise
+            return []
+        return ready
+
+    def close(self):
+        self._fds.clear()
+
+
+class EpollBackend(object):
+    """
+    Wait for file descriptors with :func:`select.epoll`, registrations are
+    kept in the kernel between calls to :meth:`poll`.
+    """
+
+    def __init__(self):
+        self._epoll = select.epoll()
+        self._fds = set()
+
+    def register(self, fd):
+        if fd in self._fds:
+            return
+        self._epoll.register(fd, select.EPOLLIN)
+        self._fds.add(fd)
+
+    def unregister(self, fd):
+        if fd not in self._fds:
+            return
+        self._fds.discard(fd)
+        try:
+            self._epoll.unregister(fd)
+        except (IOError, OSError, ValueError):
+            # already closed, the kernel dropped it
+            pass
+
+    def poll(self, timeout=None):
+        """
+        Wait up to *timeout* seconds, or forever if it is ``None``.
+
+        Returns the list of file descriptors ready for reading, or in
+        error or hang up state.
+        """
+        if timeout is None:
+            timeout = -1
+        try:
+            events = self._epoll.poll(timeout)
+        except (IOError, OSError) as e:
+            if e.args[0] != errno.EINTR:
+                raise
+            return []
+        return [fd for fd, event in events]
+
+    def close(self):
+        self._fds.clear()
+        self._epoll.close()
+
+
+def default_backend():
+    """
+    Returns a new backend, using epoll when the platform has it.
+    """
+    if hasattr(select, 'epoll'):
+        return EpollBackend()
+    return SelectBackend()
+
+
+class MainContext(object):
+
+    def __init__(self, backend=None, timer_slack=0, idle_budget=0.01):
+        if backend is None:
+            backend = default_backend()
+        self._backend = backend
+        self._alarms = TimerQueue()
+        self._firing = None
+        # timeouts may fire up to this many seconds late, so timeouts due
+        # within the same window share a single wake up
+        self.timer_slack = timer_slack
         self._watch_files = {}
-        self._idle_callbacks = []
+        self._idle_callbacks = TimerQueue()
+        self._idle_firing = None
+        # callbacks that ran in the current idle dispatch and run again
+        self._idle_again = None
+        # seconds a single idle dispatch may run callbacks for
+        self.idle_budget = idle_budget
+        # seconds spent in idle callbacks, by priority band
+        self.idle_time = {}
         self._did_something = False
 
     def iteration(self):
         """
         A single context iteration
         """
-        fds = self._watch_files.keys()
-        if self._alarms or self._did_something:
-            if self._alarms:
-                tm = self._alarms[0][0]
-                timeout = max(0, tm-time.time())
-            if self._did_something and (not self._alarms or timeout > 0):
+        tm = self._alarms.next_deadline()
+        if tm is not None or self._did_something:
+            if tm is not None:
+                timeout = max(0, tm-monotonic())
+            if self._did_something and (tm is None or timeout > 0):
                 timeout = 0
                 tm = 'idle'
-            ready, w, err = select.select(fds, [], fds, timeout)
+            ready = self._backend.poll(timeout)
         else:
-            tm = None
-            ready, w, err = select.select(fds, [], fds)
+            ready = self._backend.poll()
 
         if not ready:
             if tm == 'idle':
                 self._did_something = False
                 self._dispatch_idle()
             elif tm is not None:
-                # must gave been a timeout
-                tm, alarm_callback = self._alarms.pop(0)
-                alarm_callback()
-                self._did_something = True
+                # must have been a timeout
+                now = monotonic()
+                timer = self._alarms.pop_due(now)
+                while timer is not None:
+                    self._dispatch_timeout(timer, now)
+                    timer = self._alarms.pop_due(now)
 
         for fd in ready:
-            self._watch_files[fd]()
-            self._did_something = True
+            # an earlier callback may have removed this watch
+            callback = self._watch_files.get(fd)
+            if callback is not None:
+                callback()
+                self._did_something = True
+
+    def _dispatch_timeout(self, timer, now):
+        """
+        Call a due timeout callback, and schedule it again if it returns
+        ``True``.
+        """
+        self._firing = timer
+        keep = timer.callback()
+        if keep and timer.interval and self._firing is timer:
+            # count from the time it should have fired so the period does
+            # not drift, skipping the ticks that were missed
+            scheduled = timer.scheduled + timer.interval
+            if scheduled <= now:
+                missed = int((now - scheduled) // timer.interval) + 1
+                scheduled += missed * timer.interval
+            timer.scheduled = scheduled
+            self._alarms.restart(timer, self._slack_deadline(scheduled))
+        self._firing = None
+        self._did_something = True
+
+    def _slack_deadline(self, tm):
+        """
+        Round tm up to the timer slack, so close timeouts fire together.
+        """
+        if self.timer_slack:
+            return math.ceil(tm / self.timer_slack) * self.timer_slack
+        return tm
 
     def _dispatch_idle(self):
         """
-        Call top most priority registered idle callback.
+        Call the registered idle callbacks in priority order until there
+        are none left or :attr:`idle_budget` is spent. Callbacks returning
+        ``True`` stay registered and run again in the next dispatch.
         """
-        if self._idle_callbacks:
-            priority, idle_callback = self._idle_callbacks.pop(0)
-            idle_callback()
+        queue = self._idle_callbacks
+        again = self._idle_again = []
+        now = monotonic()
+        end = now + self.idle_budget
+        while queue.next_deadline() is not None and now < end:
+            idle = queue.pop()
+            self._idle_firing = idle
+            keep = idle.callback()
+            if keep and self._idle_firing is idle:
+                again.append(idle)
+            self._idle_firing = None
+            self._did_something = True
+
+            start, now = now, monotonic()
+            band = _priority_band(idle.deadline)
+            self.idle_time[band] = self.idle_time.get(band, 0) + now - start
+
+        self._idle_again = None
+        for idle in again:
+            queue.restart(idle, idle.deadline)
+        if queue:
+            # come back as soon as pending events are handled
             self._did_something = True
 
     def idle_add(self, callback, priority=PRIORITY_DEFAULT_IDLE):
         """
-        Add a callback for idle.
+        Add a callback for idle. Callbacks with lower priority values run
+        first, if callback returns ``True`` it is called again in the next
+        idle dispatch.
 
         Returns a handle that may be passed to :meth:`idle_remove`
         """
-        heapq.heappush(self._idle_callbacks, (priority, callback))
-        return (priority, callback)
+        return self._idle_callbacks.add(priority, callback)
 
     def idle_remove(self, handle):
         """
@@ -73,23 +408,32 @@ class MainContext(object):
 
         Returns ``True`` if the handle was removed.
         """
-        try:
-            self._idle_callbacks.remove(handle)
-            heapq.heapify(self._idle_callbacks)
+        if handle is self._idle_firing:
+            # removed from its own callback, don't keep it
+            self._idle_firing = None
             return True
-        except ValueError:
-            return False
+        if self._idle_again and handle in self._idle_again:
+            # already ran in this dispatch, don't keep it either
+            self._idle_again.remove(handle)
+            return True
+        return self._idle_callbacks.remove(handle)
 
     def timeout_add_seconds(self, seconds, callback):
         """
         Call callback() given time from now. No parameters are passed to
-        callback.
+        callback. If callback returns ``True`` it is called again every
+        *seconds* until it returns a false value or is removed.
+
+        Timeouts use a monotonic clock, changes to the system time don't
+        affect them.
 
         Returns a handle that may be passed to :meth:`timeout_remove`.
         """
-        tm = time.time() + seconds
-        heapq.heappush(self._alarms, (tm, callback))
-        return (tm, callback)
+        tm = monotonic() + seconds
+        timer = self._alarms.add(self._slack_deadline(tm), callback)
+        timer.interval = seconds
+        timer.scheduled = tm
+        return timer
 
     def timeout_remove(self, handle):
         """
@@ -98,12 +442,11 @@ class MainContext(object):
 
         Returns ``True`` if the timeout callback exists, ``False`` otherwise
         """
-        try:
-            self._alarms.remove(handle)
-            heapq.heapify(self._alarms)
+        if handle is self._firing:
+            # removed from its own callback, don't schedule it again
+            self._firing = None
             return True
-        except ValueError:
-            return False
+        return self._alarms.remove(handle)
 
     def io_add_watch(self, fd, callback):
         """
@@ -112,7 +455,10 @@ class MainContext(object):
 
         Returns a handle that may be passed to :meth:`io_remove_watch`.
         """
+        if hasattr(fd, 'fileno'):
+            fd = fd.fileno()
         self._watch_files[fd] = callback
+        self._backend.register(fd)
         return fd
 
     def io_remove_watch(self, handle):
@@ -123,6 +469,7 @@ class MainContext(object):
         """
         if handle in self._watch_files:
             del self._watch_files[handle]
+            self._backend.unregister(handle)
             return True
         return False
 
@@ -131,12 +478,11 @@ class MainContext(object):
         """
         Checks if any sources have pending event for the given context.
         """
-        fds = self._watch_files.keys()
         timeout = -1
-        if self._alarms:
-            tm = self._alarms[0][0]
-            timeout = max(0, tm-time.time())
-        ready, w, err = select.select(fds, [], fds, 0)
+        tm = self._alarms.next_deadline()
+        if tm is not None:
+            timeout = max(0, tm-monotonic())
+        ready = self._backend.poll(0)
         return bool(ready or timeout) or self._did_something
 
 class MainLoop(object):
@@ -188,6 +534,15 @@ def main_context_default():
         _default_main_context = MainContext()
     return _default_main_context
 
+def main_context_set_default(context):
+    """
+    Make context the global default main context, e.g. to run the user
+    interface on a :class:`~utk.asyncio_context.AsyncioMainContext`.
+    Must be called before any source is added to the default context.
+    """
+    global _default_main_context
+    _default_main_context = context
+
 
 # Some shortcuts to work with default main context
 def idle_add(callback, priority=PRIORITY_DEFAULT_IDLE, context=None):
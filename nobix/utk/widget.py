@@ -1,12 +1,52 @@
 # -*- coding: utf-8 -*-
 
+from signals import MetaSignals
+from screen import get_default_screen
+
+# widget states
+STATE_NORMAL      = 0
+STATE_ACTIVE      = 1
+STATE_PRELIGHT    = 2
+STATE_SELECTED    = 3
+STATE_INSENSITIVE = 4
+
+# widget flags
+VISIBLE           = 1 << 0
+MAPPED            = 1 << 1
+REALIZED          = 1 << 2
+
+# private flags
+_CHILD_VISIBLE    = 1 << 3
+_REDRAW_ON_ALLOC  = 1 << 4
+_REQUEST_NEEDED   = 1 << 5
+_ALLOC_NEEDED     = 1 << 6
+
+
+def _flag_property(flag):
+    """
+    Boolean attribute stored as a bit of the widget flags.
+    """
+    def get(self):
+        return bool(self._flags & flag)
+    def set(self, value):
+        if value:
+            self._flags |= flag
+        else:
+            self._flags &= ~flag
+    return property(get, set)
+
+
 class Widget(object):
     """
     Base class for all Utk widgets.
     """
     __metaclass__ = MetaSignals
 
-    signals = ('show', 'hide', 'map', 'unmap')
+    signals = ['show', 'hide', 'map', 'unmap', 'notify', 'size-allocate']
+
+    __slots__ = ('_state', '_saved_state', '_name', '_requisition',
+                 '_allocation', '_parent', '_flags', '_signal_callbacks',
+                 '__weakref__')
 
     _toplevel = False
 
@@ -17,19 +57,91 @@ class Widget(object):
         self._requisition = None
         self._allocation = None
         self._parent = None
+        self._signal_callbacks = None
+        self._flags = (_CHILD_VISIBLE | _REDRAW_ON_ALLOC |
+                       _REQUEST_NEEDED | _ALLOC_NEEDED)
 
-        # flags
-        self._visible = False
-        self._mapped = False
-        self._realized = False
+        super(Widget, self).__init__()
 
-        # private flags
-        self._child_visible = True
-        self._redraw_on_alloc = True
-        self._request_needed = True
-        self._alloc_needed = True
+    # flags
+    _visible = _flag_property(VISIBLE)
+    _mapped = _flag_property(MAPPED)
+    _realized = _flag_property(REALIZED)
 
-        super(Widget, self).__init__()
+    # private flags
+    _child_visible = _flag_property(_CHILD_VISIBLE)
+    _redraw_on_alloc = _flag_property(_REDRAW_ON_ALLOC)
+    _request_needed = _flag_property(_REQUEST_NEEDED)
+    _alloc_needed = _flag_property(_ALLOC_NEEDED)
+
+    parent = property(lambda self: self._parent)
+    is_toplevel = property(lambda self: self._toplevel)
+    is_visible = property(lambda self: bool(self._flags & VISIBLE))
+    is_mapped = property(lambda self: bool(self._flags & MAPPED))
+    is_realized = property(lambda self: bool(self._flags & REALIZED))
+
+    def get_toplevel(self):
+        """
+        Returns the topmost widget in the container hierarchy this widget
+        is a part of.
+        """
+        widget = self
+        while widget._parent is not None:
+            widget = widget._parent
+        return widget
+
+    def notify(self, property_name):
+        """
+        Emits the 'notify' signal for property_name on this widget.
+        """
+        self.emit('notify', property_name)
+
+    def queue_draw(self):
+        """
+        Queues a screen redraw if this widget is part of a toplevel.
+        """
+        if self.get_toplevel().is_toplevel:
+            get_default_screen().queue_draw()
+
+    def queue_resize(self):
+        """
+        Flags this widget and its parents to have their size negotiated
+        again.
+        """
+        widget = self
+        while widget is not None:
+            widget._flags |= _REQUEST_NEEDED | _ALLOC_NEEDED
+            widget = widget._parent
+
+    def size_request(self):
+        """
+        Returns the (cols, rows) size the widget wants, it is only computed
+        again after :meth:`queue_resize` was called.
+        """
+        if self._flags & _REQUEST_NEEDED or self._requisition is None:
+            self._requisition = self.do_size_request()
+            self._flags &= ~_REQUEST_NEEDED
+        return self._requisition
+
+    def do_size_request(self):
+        return (0, 0)
+
+    def size_allocate(self, allocation):
+        """
+        Assigns the (left, top, cols, rows) screen area allocation to the
+        widget.  Nothing is done when the allocation didn't change and no
+        resize was queued for the widget.
+        """
+        allocation = tuple(allocation)
+        if allocation == self._allocation and \
+                not self._flags & _ALLOC_NEEDED:
+            return
+        changed = allocation != self._allocation
+        self._allocation = allocation
+        self._flags &= ~_ALLOC_NEEDED
+        self.emit('size-allocate', allocation)
+        if changed and self._flags & _REDRAW_ON_ALLOC:
+            self.queue_draw()
 
     def show(self):
         if not self.is_visible: